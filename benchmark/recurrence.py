@@ -0,0 +1,84 @@
+import sys
+
+from src.recurrence import Recurrence
+from src.record import parse_datetime
+
+# (recurrence, start, end, time_min, time_max, start.dateTime of the instances listed with singleEvents in the window).
+# The events are in Europe/Paris, daylight saving time ends on 2021-10-31.
+CASES = [
+    # The start is not a Tuesday, it is still the first of the 3 occurrences
+    (['RRULE:FREQ=WEEKLY;COUNT=3;BYDAY=TU'], '2021-10-18T09:00:00+02:00', '2021-10-18T10:00:00+02:00',
+     '2021-10-01T00:00:00+02:00', '2021-12-01T00:00:00+01:00',
+     ['2021-10-18T09:00:00+02:00', '2021-10-19T09:00:00+02:00', '2021-10-26T09:00:00+02:00']),
+    (['RRULE:FREQ=DAILY;COUNT=5'], '2021-10-29T09:00:00+02:00', '2021-10-29T09:30:00+02:00',
+     '2021-10-01T00:00:00+02:00', '2021-12-01T00:00:00+01:00',
+     ['2021-10-29T09:00:00+02:00', '2021-10-30T09:00:00+02:00', '2021-10-31T09:00:00+01:00',
+      '2021-11-01T09:00:00+01:00', '2021-11-02T09:00:00+01:00']),
+    (['RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20211103T235959Z'], '2021-10-18T09:00:00+02:00',
+     '2021-10-18T10:00:00+02:00', '2021-10-01T00:00:00+02:00', '2021-12-01T00:00:00+01:00',
+     ['2021-10-18T09:00:00+02:00', '2021-10-20T09:00:00+02:00', '2021-11-01T09:00:00+01:00',
+      '2021-11-03T09:00:00+01:00']),
+    (['RRULE:FREQ=MONTHLY;COUNT=3;BYDAY=-1FR'], '2021-10-29T14:00:00+02:00', '2021-10-29T15:00:00+02:00',
+     '2021-10-01T00:00:00+02:00', '2022-06-01T00:00:00+02:00',
+     ['2021-10-29T14:00:00+02:00', '2021-11-26T14:00:00+01:00', '2021-12-31T14:00:00+01:00']),
+    # Months without a 31st are skipped
+    (['RRULE:FREQ=MONTHLY;COUNT=3;BYMONTHDAY=31'], '2021-10-31T08:00:00+01:00', '2021-10-31T08:30:00+01:00',
+     '2021-10-01T00:00:00+02:00', '2022-06-01T00:00:00+02:00',
+     ['2021-10-31T08:00:00+01:00', '2021-12-31T08:00:00+01:00', '2022-01-31T08:00:00+01:00']),
+    # Last weekday of the month
+    (['RRULE:FREQ=MONTHLY;COUNT=3;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1'], '2021-10-29T17:00:00+02:00',
+     '2021-10-29T18:00:00+02:00', '2021-10-01T00:00:00+02:00', '2022-06-01T00:00:00+02:00',
+     ['2021-10-29T17:00:00+02:00', '2021-11-30T17:00:00+01:00', '2021-12-31T17:00:00+01:00']),
+    (['RRULE:FREQ=YEARLY;COUNT=2;BYMONTH=2;BYMONTHDAY=29'], '2024-02-29T12:00:00+01:00', '2024-02-29T13:00:00+01:00',
+     '2024-01-01T00:00:00+01:00', '2030-01-01T00:00:00+01:00',
+     ['2024-02-29T12:00:00+01:00', '2028-02-29T12:00:00+01:00']),
+    # Only the occurrences in the window, without the excluded one
+    (['RRULE:FREQ=DAILY', 'EXDATE;TZID=Europe/Paris:20211020T090000'], '2021-10-18T09:00:00+02:00',
+     '2021-10-18T10:00:00+02:00', '2021-10-19T00:00:00+02:00', '2021-10-22T00:00:00+02:00',
+     ['2021-10-19T09:00:00+02:00', '2021-10-21T09:00:00+02:00']),
+    # The occurrence in progress at the start of the window overlaps it
+    (['RRULE:FREQ=DAILY'], '2021-10-18T23:30:00+02:00', '2021-10-19T00:30:00+02:00',
+     '2021-10-20T00:00:00+02:00', '2021-10-21T00:00:00+02:00',
+     ['2021-10-19T23:30:00+02:00', '2021-10-20T23:30:00+02:00']),
+    (['RRULE:FREQ=DAILY', 'RDATE;TZID=Europe/Paris:20211023T150000'], '2021-10-18T09:00:00+02:00',
+     '2021-10-18T10:00:00+02:00', '2021-10-23T00:00:00+02:00', '2021-10-24T00:00:00+02:00',
+     ['2021-10-23T09:00:00+02:00', '2021-10-23T15:00:00+02:00']),
+]
+
+
+def item(recurrence, start, end):
+    return {
+        'id': 'series',
+        'start': {'dateTime': start, 'timeZone': 'Europe/Paris'},
+        'end': {'dateTime': end, 'timeZone': 'Europe/Paris'},
+        'recurrence': recurrence,
+    }
+
+
+# Compares the local expansion to the instances listed by the API with singleEvents, and the end of the series
+# computed from the last one when the window covers the whole series
+def main():
+    failures = 0
+    for recurrence, start, end, time_min, time_max, expected in CASES:
+        series = Recurrence(item(recurrence, start, end))
+        starts = [occurrence.isoformat() for occurrence in series.starts(parse_datetime(time_min),
+                                                                           parse_datetime(time_max))]
+        errors = []
+        if starts != expected:
+            errors.append('expected {0}, got {1}'.format(expected, starts))
+
+        if all('COUNT' in line or 'UNTIL' in line for line in recurrence if line.startswith('RRULE')):
+            last = parse_datetime(expected[-1]) + series.duration
+            if series.end() != last:
+                errors.append('ends at {0}, expected {1}'.format(series.end().isoformat(), last.isoformat()))
+
+        print('{0} {1}'.format('FAIL' if errors else 'OK', ' '.join(recurrence)))
+        for error in errors:
+            print('  ' + error)
+        failures += bool(errors)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
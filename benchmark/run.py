@@ -0,0 +1,496 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from os import path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DIRECTORY = path.dirname(path.abspath(__file__))
+RESULTS_PATH = path.join(DIRECTORY, 'results.jsonl')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Measure the refresh of the agenda against a local fake Calendar API')
+    parser.add_argument('--calendars', type=int, default=5, help='Number of calendars')
+    parser.add_argument('--events', type=int, default=40, help='Number of events per calendar')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of each request, in seconds')
+    parser.add_argument('--accounts', type=int, default=1, help='Number of accounts, with calendars each')
+    parser.add_argument('--shared', type=float, default=0.2,
+                        help='Fraction of the events of the first account the other accounts are invited to')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of the API requests failing')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of the 429 responses, in seconds')
+    parser.add_argument('--backoff', type=float, default=0.1, help='First backoff of the retries, in seconds')
+    parser.add_argument('--outage', action='store_true',
+                        help='Refresh during an outage of the API, with a dropped probe, then once it is over')
+    parser.add_argument('--cooldown', type=float, default=1.0, help='Cooldown of the circuit breaker, in seconds')
+    parser.add_argument('--series', type=int, default=0,
+                        help='Number of daily and weekly recurring events per calendar')
+    parser.add_argument('--recurrence', choices=['server', 'local'], default='server',
+                        help='Expand the recurring events with singleEvents on the server, or locally')
+    parser.add_argument('--compare-recurrence', action='store_true',
+                        help='Compare to the last run with the same parameters expanding the recurring events on the '
+                             'server')
+    parser.add_argument('--busy', type=int, default=0,
+                        help='Number of team calendars only shown as busy blocks, with events per calendar each')
+    parser.add_argument('--page-size', type=int, default=None, help='Page size of the list requests')
+    parser.add_argument('--changes', type=int, default=10, help='Number of events changed before the last refresh')
+    parser.add_argument('--window-mode', choices=['today', 'hours', 'days'], default='today')
+    parser.add_argument('--window-size', type=int, default=1, help='Hours or days of the window')
+    parser.add_argument('--renderer', choices=['widgets', 'list', 'auto'], default='widgets')
+    parser.add_argument('--shadows', choices=['effect', 'pixmap', 'none', 'auto'], default='auto',
+                        help='Shadow of the event widgets, the repaints are measured with each one anyway')
+    parser.add_argument('--full-responses', action='store_true', help='Request full events, without fields mask')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Measure the peak of the Python allocations, tracing them makes every phase slower')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120, help='Maximum duration of a refresh, in seconds')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON lines file the results are appended to')
+
+    return parser.parse_args()
+
+
+# APPDATA and the Qt settings are found from the home directory, it must be replaced before they are imported
+def isolate(home):
+    os.environ['HOME'] = home
+    os.environ['APPDATA'] = home
+    os.environ['XDG_CONFIG_HOME'] = path.join(home, '.config')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    sys.path.insert(0, path.dirname(DIRECTORY))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORY,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def benchmark(arguments):
+    from PyQt5.QtCore import QEventLoop, QSettings, QTimer, qInstallMessageHandler
+    from PyQt5.QtWidgets import QApplication
+
+    from benchmark.server import FakeCalendarServer, discovery_document
+    from main import APPDATA, NAME, SCOPES
+    from src.account import ACCOUNTS_PATH, DEFAULT_ACCOUNT, Account
+    from src.client import ResilientHttp
+    from src.discovery import DISCOVERY_PATH
+    from src.event import Event
+    from src.metrics import metrics
+    from src.shadow import SHADOWS
+    from src.transport import transport
+    from src.ui import Ui
+    from src.window import window_end
+
+    os.mkdir(APPDATA)
+    os.mkdir(ACCOUNTS_PATH)
+
+    # Refreshes are timed from the scheduler to the end of the display, the event loop is left when they are over
+    class BenchmarkUi(Ui):
+        loop = None
+        refresh_started = None
+        refreshes = []
+        displays = []
+
+        def start_refresh(self):
+            self.refresh_started = time.perf_counter()
+            super(BenchmarkUi, self).start_refresh()
+
+        def display(self, events, source='network'):
+            start = time.perf_counter()
+            super(BenchmarkUi, self).display(events, source)
+            self.displays.append((source, time.perf_counter() - start))
+
+        def refresh_finished(self):
+            super(BenchmarkUi, self).refresh_finished()
+            self.refreshes.append(time.perf_counter() - self.refresh_started)
+            if self.loop is not None:
+                self.loop.quit()
+
+    errors = []
+
+    # Errors of the workers are reported instead of closing the application
+    def except_hook(cls, exception, traceback):
+        errors.append('{0}: {1}'.format(cls.__name__, exception))
+        sys.__excepthook__(cls, exception, traceback)
+
+    sys.excepthook = except_hook
+
+    # The offscreen platform warns on every resize of the window
+    def message_handler(kind, context, message):
+        if 'propagateSizeHints' not in message:
+            sys.stderr.write(message + '\n')
+
+    qInstallMessageHandler(message_handler)
+
+    app = QApplication(sys.argv)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    end = window_end(now, arguments.window_mode, arguments.window_size)
+    server = FakeCalendarServer(now, end, arguments.calendars, arguments.events, arguments.latency,
+                                arguments.page_size, arguments.seed, arguments.busy, arguments.accounts,
+                                arguments.shared, arguments.failure_rate, arguments.retry_after, arguments.series)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with open(DISCOVERY_PATH, 'w') as file:
+        json.dump(discovery_document(server.url), file)
+
+    names = [DEFAULT_ACCOUNT] + ['account{0}'.format(number) for number in range(2, arguments.accounts + 1)]
+    QSettings(NAME, NAME).setValue('accounts', names[1:])
+    for index, name in enumerate(names):
+        with open(Account(name).token_path, 'w') as file:
+            json.dump({'token': server.token(index), 'refresh_token': 'benchmark', 'client_id': 'benchmark',
+                       'client_secret': 'benchmark', 'scopes': SCOPES, 'expiry': '2999-01-01T00:00:00Z'}, file)
+
+    def wait(ui):
+        ui.loop = QEventLoop()
+        QTimer.singleShot(int(arguments.timeout * 1000), ui.loop.quit)
+        ui.loop.exec_()
+        ui.loop = None
+
+    # Until the circuit breaker lets a request through again
+    def cool_down():
+        loop = QEventLoop()
+        QTimer.singleShot(int(arguments.cooldown * 1000), loop.quit)
+        loop.exec_()
+
+    def wait_refresh(ui):
+        before = server.statistics()
+        before_metrics = metrics.snapshot()
+        displays = len(ui.displays)
+
+        wait(ui)
+
+        after = server.statistics()
+        after_metrics = metrics.snapshot()
+        return {
+            'wall': ui.refreshes[-1] if ui.refreshes else None,
+            'display': sum(duration for source, duration in ui.displays[displays:] if source == 'network'),
+            'round_trips': after['round_trips'] - before['round_trips'],
+            'requests': {name: count - before['requests'].get(name, 0) for name, count in after['requests'].items()
+                         if count != before['requests'].get(name, 0)},
+            'bytes': after['bytes'] - before['bytes'],
+            # Decompressed size of the API responses and the time spent parsing them
+            'payload': (after_metrics['counters'].get('api bytes received', 0)
+                        - before_metrics['counters'].get('api bytes received', 0)),
+            'parse': (after_metrics['spans'].get('parse', {}).get('total', 0)
+                      - before_metrics['spans'].get('parse', {}).get('total', 0)),
+            'retries': (after_metrics['counters'].get('api retries', 0)
+                        - before_metrics['counters'].get('api retries', 0)),
+            'events': len(ui.events),
+            'busy_blocks': sum(len(blocks) for _, blocks in ui.busy),
+        }
+
+    # Retries and recovery are shortened, the delays of the application would make every run last minutes
+    ResilientHttp.backoff = arguments.backoff
+    transport.breaker.cooldown = arguments.cooldown
+
+    if arguments.trace_memory:
+        tracemalloc.start()
+    phases = {}
+
+    started = time.perf_counter()
+    ui = BenchmarkUi()
+    ui.renderer = arguments.renderer
+    ui.shadows = arguments.shadows
+    ui.window_mode = arguments.window_mode
+    ui.window_size = arguments.window_size
+    ui.partial_responses = not arguments.full_responses
+    ui.sync.partial = ui.partial_responses
+    ui.local_recurrence = arguments.recurrence == 'local'
+    ui.sync.expand_recurrence = ui.local_recurrence
+    ui.busy_calendars = ['team{0}@benchmark.test'.format(index) for index in range(arguments.busy)]
+    ui.show()
+
+    # Nothing is stored yet: calendar list, full sync of every calendar and construction of every widget
+    phases['cold'] = wait_refresh(ui)
+    phases['cold']['first_paint'] = time.perf_counter() - started
+
+    time_min, time_max = ui.window()
+    expected = server.expected(time_min, time_max)
+    displayed = [record.id for record in ui.events]
+    starts = [record.start for record in ui.events]
+    complete = set(displayed) == expected and len(displayed) == len(expected)
+    ordered = starts == sorted(starts)
+
+    # Sync tokens only, nothing changed
+    ui.refresh()
+    phases['warm'] = wait_refresh(ui)
+
+    server.mutate(arguments.changes)
+    ui.refresh()
+    phases['changes'] = wait_refresh(ui)
+
+    # Every request fails: the last agenda must stay displayed, then come back once the circuit closes again
+    if arguments.outage:
+        displayed = [record.id for record in ui.events]
+        server.outage = True
+        ui.refresh()
+        phases['outage'] = wait_refresh(ui)
+        if ui.failed_at is None:
+            errors.append('The outage was not detected')
+        if [record.id for record in ui.events] != displayed:
+            errors.append('The last agenda was not kept during the outage')
+
+        # The first request after the cooldown is cut short: the refresh fails and the circuit opens again,
+        # the requests after the next cooldown must not wait for that probe forever
+        server.outage = False
+        server.truncated = 1
+        cool_down()
+        ui.refresh()
+        phases['probe'] = wait_refresh(ui)
+        if ui.failed_at is None:
+            errors.append('The failed probe was not detected')
+
+        cool_down()
+        ui.refresh()
+        phases['recovery'] = wait_refresh(ui)
+        if ui.failed_at is not None:
+            errors.append('Not recovered after the outage')
+
+    # Details of the first event, as when its tooltip is shown
+    details = None
+    if ui.events and ui.partial_responses:
+        record = ui.events[0]
+        ui.details_loaded.connect(lambda event_id: ui.loop.quit() if ui.loop is not None else None)
+        start = time.perf_counter()
+        ui.load_details(record)
+        wait(ui)
+        details = time.perf_counter() - start
+        if not record.details:
+            errors.append('Details of {0} not loaded'.format(record.id))
+
+    # The Event construction path alone, whatever the renderer
+    start = time.perf_counter()
+    widgets = [Event(ui, record) for record in ui.events]
+    widgets_duration = time.perf_counter() - start
+    for widget in widgets:
+        widget.deleteLater()
+
+    # Steady state of the countdowns, no event changes state between the ticks: nothing is restyled
+    ticks = 100
+    restyles = metrics.snapshot()['counters'].get('restyles', 0)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        ui.ticker.tick()
+    tick_duration = (time.perf_counter() - start) / ticks
+    tick_restyles = metrics.snapshot()['counters'].get('restyles', 0) - restyles
+
+    # CPU time of the repaints of the countdowns, as every second, with each kind of shadow.
+    # Only the first events are displayed, as many as the offscreen screen shows without squeezing them.
+    repaints = {}
+    repaint_count = 20
+    events = ui.events
+    if ui.event_widgets:
+        for shadows in SHADOWS[:-1]:
+            ui.shadows = shadows
+            ui.display(events[:7])
+            app.processEvents()
+            labels = [widget.timer_label for widget in ui.event_widgets.values()
+                      if widget.timer_label is not None and not widget.timer_label.visibleRegion().isEmpty()]
+            start = time.process_time()
+            for _ in range(repaint_count):
+                for label in labels:
+                    label.repaint()
+            repaints[shadows] = {
+                'labels': len(labels),
+                'per_repaint': (time.process_time() - start) / (repaint_count * len(labels)) if labels else None,
+            }
+
+        ui.shadows = arguments.shadows
+        ui.display(events)
+
+    python_peak = None
+    if arguments.trace_memory:
+        python_peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    ui.hide()
+    server.shutdown()
+    app.processEvents()
+
+    if len(ui.refreshes) < len(phases):
+        errors.append('Timeout after {0}s'.format(arguments.timeout))
+    if not complete:
+        errors.append('Displayed {0} events, {1} expected'.format(len(displayed), len(expected)))
+    if not ordered:
+        errors.append('Events are not displayed in start order')
+    if len(ui.busy) != arguments.busy:
+        errors.append('Busy blocks of {0} calendars, {1} expected'.format(len(ui.busy), arguments.busy))
+
+    return {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'parameters': {
+            'calendars': arguments.calendars,
+            'events': arguments.events,
+            'accounts': arguments.accounts,
+            'shared': arguments.shared,
+            'busy': arguments.busy,
+            'series': arguments.series,
+            'recurrence': arguments.recurrence,
+            'latency': arguments.latency,
+            'page_size': arguments.page_size,
+            'changes': arguments.changes,
+            'window_mode': arguments.window_mode,
+            'window_size': arguments.window_size,
+            'renderer': arguments.renderer,
+            'shadows': arguments.shadows,
+            'full_responses': arguments.full_responses,
+            'trace_memory': arguments.trace_memory,
+            'failure_rate': arguments.failure_rate,
+            'retry_after': arguments.retry_after,
+            'backoff': arguments.backoff,
+            'outage': arguments.outage,
+            'seed': arguments.seed,
+        },
+        'startup': ui.startup,
+        'phases': phases,
+        'details': details,
+        'event_widgets': {
+            'count': len(widgets),
+            'duration': widgets_duration,
+            'per_widget': widgets_duration / len(widgets) if widgets else None,
+        },
+        'repaints': repaints,
+        'ticks': {
+            'count': ticks,
+            'per_tick': tick_duration,
+            'restyles': tick_restyles,
+        },
+        'memory': {
+            'python_peak_kb': python_peak,
+            'peak_rss_kb': peak_rss(),
+        },
+        'metrics': metrics.snapshot(),
+        'complete': complete,
+        'ordered': ordered,
+        'errors': errors,
+    }
+
+
+def previous_result(output, parameters):
+    if not path.exists(output):
+        return None
+
+    result = None
+    with open(output) as file:
+        for line in file:
+            if line.strip():
+                candidate = json.loads(line)
+                if candidate['parameters'] == parameters:
+                    result = candidate
+
+    return result
+
+
+def report(result, previous):
+    def compare(value, old):
+        if old is None or value is None or not old:
+            return ''
+
+        return ' ({0:+.0%})'.format((value - old) / old)
+
+    def old(*keys):
+        value = previous
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+
+        return value
+
+    print('Benchmark of {0} ({1})'.format(result['commit'] or 'working tree', json.dumps(result['parameters'])))
+    if previous is not None:
+        print('Compared to {0} of {1}'.format(previous['commit'] or 'working tree', previous['date']))
+
+    for name, phase in result['phases'].items():
+        print('  {0:8} {1:7.3f}s{2:8}  display {3:7.3f}s{4:8}  {5:4} round-trips{6:8}  {7:8} bytes  {8} events'.format(
+            name,
+            phase['wall'] or 0, compare(phase['wall'], old('phases', name, 'wall')),
+            phase['display'], compare(phase['display'], old('phases', name, 'display')),
+            phase['round_trips'], compare(phase['round_trips'], old('phases', name, 'round_trips')),
+            phase['bytes'], phase['events'],
+        ))
+        print('  {0:8} payload {1:9} bytes{2:8}  parse {3:7.3f}s{4:8}  {5} busy blocks  {6} retries'.format(
+            '',
+            phase['payload'], compare(phase['payload'], old('phases', name, 'payload')),
+            phase['parse'], compare(phase['parse'], old('phases', name, 'parse')),
+            phase['busy_blocks'], phase['retries'],
+        ))
+
+    if result['details'] is not None:
+        print('  Details of an event loaded in {0:.3f}s'.format(result['details']))
+
+    widgets = result['event_widgets']
+    print('  {0} Event widgets built in {1:.3f}s{2}'.format(
+        widgets['count'], widgets['duration'], compare(widgets['duration'], old('event_widgets', 'duration'))))
+
+    for shadows, repaint in result['repaints'].items():
+        if repaint['per_repaint'] is not None:
+            print('  Countdown repaint with {0:6} shadow: {1:.6f}s of CPU{2}, {3} visible events'.format(
+                shadows, repaint['per_repaint'],
+                compare(repaint['per_repaint'], old('repaints', shadows, 'per_repaint')), repaint['labels']))
+
+    ticks = result['ticks']
+    print('  Tick of the countdowns in {0:.6f}s{1}, {2} restyles in {3} ticks'.format(
+        ticks['per_tick'], compare(ticks['per_tick'], old('ticks', 'per_tick')), ticks['restyles'], ticks['count']))
+
+    memory = result['memory']
+    text = '{0} KB resident{1}'.format(memory['peak_rss_kb'],
+                                       compare(memory['peak_rss_kb'], old('memory', 'peak_rss_kb')))
+    if memory['python_peak_kb'] is not None:
+        text = '{0} KB of Python objects{1}, {2}'.format(
+            memory['python_peak_kb'], compare(memory['python_peak_kb'], old('memory', 'python_peak_kb')), text)
+    print('  Peak memory: ' + text)
+
+    print('  Startup: ' + ', '.join('{0}: {1:.3f}s'.format(*timing) for timing in result['startup'].items()))
+
+    for error in result['errors']:
+        print('  Error: ' + error)
+
+
+def main():
+    arguments = parse_arguments()
+    output = path.abspath(arguments.output)
+
+    with tempfile.TemporaryDirectory(prefix='today-overview-benchmark-') as home:
+        isolate(home)
+        result = benchmark(arguments)
+
+    parameters = result['parameters']
+    if arguments.compare_recurrence:
+        parameters = dict(parameters, recurrence='server')
+    report(result, previous_result(output, parameters))
+
+    with open(output, 'a') as file:
+        file.write(json.dumps(result) + '\n')
+
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,741 @@
+import base64
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from zoneinfo import ZoneInfo
+
+from src.record import parse_datetime
+from src.store import utc
+
+# 1x1 transparent PNG, served as the conference icon
+ICON = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+
+RESPONSE_STATUSES = ['accepted'] * 6 + ['needsAction'] * 2 + ['tentative', 'declined']
+DURATIONS = [15, 30, 30, 45, 60, 60, 90]
+# Timezones of the organizers of the recurring events
+SERIES_TIMEZONES = ['Europe/Paris', 'America/New_York', 'UTC', 'Asia/Tokyo']
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+# Failures injected by failure_rate, as (status, reason)
+FAILURES = [(429, 'rateLimitExceeded'), (403, 'userRateLimitExceeded'), (500, 'backendError'), (503, 'backendError')]
+
+
+# Only the methods called by the application, enough for googleapiclient to build the service
+def discovery_document(root_url):
+    def parameter(kind='string', location='query', **kwargs):
+        return dict(type=kind, location=location, **kwargs)
+
+    return {
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': 'calendar:v3',
+        'name': 'calendar',
+        'version': 'v3',
+        'protocol': 'rest',
+        'rootUrl': root_url,
+        'servicePath': 'calendar/v3/',
+        'baseUrl': root_url + 'calendar/v3/',
+        'batchPath': 'batch/calendar/v3',
+        'parameters': {
+            'alt': parameter(default='json', enum=['json']),
+            'fields': parameter(),
+            'key': parameter(),
+            'oauth_token': parameter(),
+            'prettyPrint': parameter('boolean', default='true'),
+            'quotaUser': parameter(),
+            'userIp': parameter(),
+        },
+        # Methods without a response schema return raw bytes
+        'schemas': {
+            'CalendarList': {'id': 'CalendarList', 'type': 'object'},
+            'Events': {'id': 'Events', 'type': 'object'},
+            'Event': {'id': 'Event', 'type': 'object'},
+            'FreeBusyRequest': {'id': 'FreeBusyRequest', 'type': 'object'},
+            'FreeBusyResponse': {'id': 'FreeBusyResponse', 'type': 'object'},
+        },
+        'resources': {
+            'calendarList': {
+                'methods': {
+                    'list': {
+                        'id': 'calendar.calendarList.list',
+                        'path': 'users/me/calendarList',
+                        'httpMethod': 'GET',
+                        'response': {'$ref': 'CalendarList'},
+                        'parameters': {
+                            'maxResults': parameter('integer', format='int32'),
+                            'minAccessRole': parameter(),
+                            'pageToken': parameter(),
+                            'showDeleted': parameter('boolean'),
+                            'showHidden': parameter('boolean'),
+                            'syncToken': parameter(),
+                        },
+                    },
+                },
+            },
+            'events': {
+                'methods': {
+                    'list': {
+                        'id': 'calendar.events.list',
+                        'path': 'calendars/{calendarId}/events',
+                        'httpMethod': 'GET',
+                        'response': {'$ref': 'Events'},
+                        'parameters': {
+                            'calendarId': parameter(location='path', required=True),
+                            'maxAttendees': parameter('integer', format='int32'),
+                            'maxResults': parameter('integer', format='int32'),
+                            'orderBy': parameter(),
+                            'pageToken': parameter(),
+                            'showDeleted': parameter('boolean'),
+                            'singleEvents': parameter('boolean'),
+                            'syncToken': parameter(),
+                            'timeMax': parameter(format='date-time'),
+                            'timeMin': parameter(format='date-time'),
+                            'timeZone': parameter(),
+                        },
+                        'parameterOrder': ['calendarId'],
+                    },
+                    'get': {
+                        'id': 'calendar.events.get',
+                        'path': 'calendars/{calendarId}/events/{eventId}',
+                        'httpMethod': 'GET',
+                        'response': {'$ref': 'Event'},
+                        'parameters': {
+                            'calendarId': parameter(location='path', required=True),
+                            'eventId': parameter(location='path', required=True),
+                            'maxAttendees': parameter('integer', format='int32'),
+                            'timeZone': parameter(),
+                        },
+                        'parameterOrder': ['calendarId', 'eventId'],
+                    },
+                },
+            },
+            'freebusy': {
+                'methods': {
+                    'query': {
+                        'id': 'calendar.freebusy.query',
+                        'path': 'freeBusy',
+                        'httpMethod': 'POST',
+                        'request': {'$ref': 'FreeBusyRequest'},
+                        'response': {'$ref': 'FreeBusyResponse'},
+                    },
+                },
+            },
+        },
+    }
+
+
+def google_datetime(date):
+    return date.isoformat(timespec='seconds')
+
+
+# Partial response mask, like 'items(id,start/dateTime),nextPageToken': {field: sub mask or None for everything}
+def parse_fields(mask):
+    fields = {}
+    position = 0
+    while position < len(mask):
+        end = position
+        while end < len(mask) and mask[end] not in ',()':
+            end += 1
+
+        path = mask[position:end].strip().split('/')
+        node = fields
+        for name in path[:-1]:
+            if node.get(name) is None:
+                node[name] = {}
+            node = node[name]
+        node.setdefault(path[-1], None)
+        position = end
+
+        if position < len(mask) and mask[position] == '(':
+            depth = 1
+            close = position + 1
+            while depth:
+                depth += {'(': 1, ')': -1}.get(mask[close], 0)
+                close += 1
+            node[path[-1]] = parse_fields(mask[position + 1:close - 1])
+            position = close
+
+        position += 1
+
+    return fields
+
+
+def project(value, fields):
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {name: project(value[name], sub_fields) for name, sub_fields in fields.items() if name in value}
+
+    return value
+
+
+# Stand-in for the Calendar v3 API, serving synthetic calendars and events on localhost.
+# Every change bumps a version, sync tokens and page tokens carry the version they were created at.
+# Each account has its own access token and calendar list, a shared fraction of the events of the first account
+# are also in the primary calendar of the others, as invitations are.
+# A failure_rate fraction of the API requests fail, every one of them during an outage.
+# The truncated next responses are cut short, the client raises ChunkedEncodingError instead of a failure status.
+# Calendars also have series daily and weekly recurring events, expanded into instances up to horizon_days after
+# the window when singleEvents is set.
+class FakeCalendarServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    events_page_size = 250
+    calendars_page_size = 100
+    horizon_days = 30
+
+    def __init__(self, time_min, time_max, calendars=3, events=20, latency=0.0, page_size=None, seed=0, busy=0,
+                 accounts=1, shared=0.2, failure_rate=0.0, retry_after=1, series=0, address=('127.0.0.1', 0)):
+        super(FakeCalendarServer, self).__init__(address, FakeCalendarHandler)
+
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.outage = False
+        # The next truncated responses are cut short after their headers, as a dropped connection
+        self.truncated = 0
+        self.horizon = time_max + datetime.timedelta(days=self.horizon_days)
+        if page_size:
+            self.events_page_size = page_size
+            self.calendars_page_size = page_size
+
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.version = 1
+        self.requests = Counter()
+        self.sent = 0
+
+        # By account
+        self.calendar_lists = [[] for _ in range(accounts)]
+        # By calendar id then event id: (version, event)
+        self.events = {}
+
+        for account in range(accounts):
+            name = 'user' if account == 0 else 'a{0}user'.format(account)
+            for index in range(calendars):
+                self.add_calendar(account, index, events, time_min, time_max, name, series=series)
+        # Team calendars of which only the free/busy information can be read
+        for index in range(busy):
+            self.add_calendar(0, index, events, time_min, time_max, 'team', 'freeBusyReader', series)
+
+        if calendars:
+            primary = self.calendar_lists[0][0]['id']
+            for account in range(1, accounts):
+                invited = self.calendar_lists[account][0]['id']
+                for event_id, entry in self.events[primary].items():
+                    if self.random.random() < shared:
+                        self.events[invited][event_id] = entry
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/'.format(*self.server_address)
+
+    @staticmethod
+    def token(account):
+        return 'benchmark' if account == 0 else 'benchmark{0}'.format(account)
+
+    def account(self, authorization):
+        for account in range(len(self.calendar_lists)):
+            if authorization == 'Bearer ' + self.token(account):
+                return account
+
+        return None
+
+    def add_calendar(self, account, index, count, time_min, time_max, name='user', access_role=None, series=0):
+        calendar_id = '{0}{1}@benchmark.test'.format(name, index)
+        offset = datetime.timezone(datetime.timedelta(hours=index % 3))
+        self.calendar_lists[account].append({
+            'kind': 'calendar#calendarListEntry',
+            'etag': '"{0}"'.format(self.version),
+            'id': calendar_id,
+            'summary': '{0} calendar {1}'.format(name.capitalize(), index),
+            'timeZone': 'UTC',
+            'accessRole': access_role or ('owner' if index % 4 != 3 else 'reader'),
+            'primary': index == 0,
+        })
+
+        events = {}
+        span = max(60, (time_max - time_min).total_seconds() - 60)
+        for number in range(count):
+            event = self.synthetic_event(calendar_id, number, time_min, span, offset)
+            events[event['id']] = (self.version, event)
+        for number in range(series):
+            self.add_series(events, calendar_id, number, time_min, time_max, span, offset)
+        self.events[calendar_id] = events
+
+    # Daily and weekly meetings started before the window in the timezone of their organizer, some with an
+    # occurrence of the window excluded, moved or cancelled
+    def add_series(self, events, calendar_id, number, time_min, time_max, span, offset):
+        event = self.synthetic_event(calendar_id, number, time_min, span, offset)
+        name = calendar_id.split('@')[0]
+        tz = ZoneInfo(SERIES_TIMEZONES[number % len(SERIES_TIMEZONES)])
+
+        day = time_min.astimezone(tz).date() - datetime.timedelta(days=self.random.randint(7, 60))
+        if number % 2 == 0:
+            rule = 'RRULE:FREQ=DAILY'
+        else:
+            weekdays = sorted(self.random.sample(range(5), self.random.randint(1, 3)))
+            rule = 'RRULE:FREQ=WEEKLY;BYDAY=' + ','.join(WEEKDAYS[weekday] for weekday in weekdays)
+            while day.weekday() not in weekdays:
+                day += datetime.timedelta(days=1)
+        start = datetime.datetime.combine(day, datetime.time(self.random.randint(0, 23), self.random.choice([0, 30])),
+                                          tzinfo=tz)
+        end = start + datetime.timedelta(minutes=self.random.choice(DURATIONS))
+
+        event.update({
+            'id': 'series{0}x{1}'.format(name, number),
+            'iCalUID': 'series{0}x{1}@google.com'.format(name, number),
+            'summary': 'Recurring meeting {0} of {1}'.format(number, calendar_id),
+            'start': {'dateTime': google_datetime(start), 'timeZone': tz.key},
+            'end': {'dateTime': google_datetime(end), 'timeZone': tz.key},
+            'recurrence': [rule],
+        })
+
+        instances = [instance for instance in self.instances(event) if self.overlaps(instance, time_min, time_max)]
+        self.random.shuffle(instances)
+        if instances and self.random.random() < 0.3:
+            excluded = parse_datetime(instances.pop()['start']['dateTime'])
+            event['recurrence'].append('EXDATE;TZID={0}:{1:%Y%m%dT%H%M%S}'.format(tz.key, excluded))
+        if instances and self.random.random() < 0.3:
+            moved = dict(instances.pop())
+            for key in ('start', 'end'):
+                date = parse_datetime(moved[key]['dateTime']) + datetime.timedelta(hours=1)
+                moved[key] = dict(moved[key], dateTime=google_datetime(date))
+            moved['summary'] += ' (moved)'
+            events[moved['id']] = (self.version, moved)
+        if instances and self.random.random() < 0.3:
+            cancelled = instances.pop()
+            events[cancelled['id']] = (self.version, {
+                'kind': 'calendar#event',
+                'etag': '"{0}"'.format(self.version),
+                'id': cancelled['id'],
+                'status': 'cancelled',
+                'recurringEventId': event['id'],
+                'originalStartTime': cancelled['originalStartTime'],
+            })
+
+        events[event['id']] = (self.version, event)
+
+    # Instances of a recurring event until the horizon, only the rules of add_series are known
+    def instances(self, event):
+        tz = ZoneInfo(event['start']['timeZone'])
+        start = parse_datetime(event['start']['dateTime']).astimezone(tz)
+        duration = parse_datetime(event['end']['dateTime']) - start
+
+        weekdays = range(7)
+        excluded = set()
+        for line in event['recurrence']:
+            if line.startswith('RRULE:FREQ=WEEKLY;BYDAY='):
+                weekdays = [WEEKDAYS.index(day) for day in line.split('=')[-1].split(',')]
+            elif line.startswith('EXDATE'):
+                excluded.add(line.split(':')[1])
+
+        instances = []
+        day = start.date()
+        while True:
+            date = datetime.datetime.combine(day, start.time(), tzinfo=tz)
+            if date > self.horizon:
+                return instances
+
+            if day.weekday() in weekdays and '{0:%Y%m%dT%H%M%S}'.format(date) not in excluded:
+                instance = dict(event)
+                del instance['recurrence']
+                instance['id'] = '{0}_{1:%Y%m%dT%H%M%SZ}'.format(event['id'], date.astimezone(datetime.timezone.utc))
+                instance['start'] = dict(event['start'], dateTime=google_datetime(date))
+                instance['end'] = dict(event['end'], dateTime=google_datetime(
+                    (date.astimezone(datetime.timezone.utc) + duration).astimezone(tz)))
+                instance['recurringEventId'] = event['id']
+                instance['originalStartTime'] = instance['start']
+                instances.append(instance)
+
+            day += datetime.timedelta(days=1)
+
+    # (version, event) as listed: with single_events the recurring events are replaced by their instances,
+    # and an instance by its exception
+    def listed(self, entries, single_events):
+        if not single_events:
+            return entries
+
+        exceptions = {event['id']: (version, event) for version, event in entries if 'recurringEventId' in event}
+        result = []
+        for version, event in entries:
+            if 'recurrence' in event:
+                result.extend(exceptions.get(instance['id'], (version, instance)) for instance in self.instances(event))
+            elif 'recurringEventId' not in event:
+                result.append((version, event))
+
+        return result
+
+    def synthetic_event(self, calendar_id, number, time_min, span, offset):
+        start = time_min + datetime.timedelta(seconds=60 + self.random.random() * span)
+        start = start.replace(second=0, microsecond=0).astimezone(offset)
+        end = start + datetime.timedelta(minutes=self.random.choice(DURATIONS))
+
+        event = {
+            'kind': 'calendar#event',
+            'etag': '"{0}"'.format(self.version),
+            'id': 'event{0}x{1}'.format(calendar_id.split('@')[0], number),
+            'status': 'confirmed',
+            'htmlLink': 'https://www.google.com/calendar/event?eid={0}'.format(number),
+            'created': '2021-01-01T00:00:00.000Z',
+            'updated': '2021-01-01T00:00:00.000Z',
+            'summary': 'Meeting {0} of {1}'.format(number, calendar_id),
+            'creator': {'email': calendar_id, 'self': True},
+            'organizer': {'email': calendar_id, 'displayName': 'Organizer', 'self': True},
+            'start': {'dateTime': google_datetime(start)},
+            'end': {'dateTime': google_datetime(end)},
+            'iCalUID': 'event{0}x{1}@google.com'.format(calendar_id.split('@')[0], number),
+            'sequence': 0,
+            'eventType': 'default',
+            'reminders': {'useDefault': True},
+        }
+
+        # A few all day events, which are not displayed
+        if self.random.random() < 0.05:
+            event['start'] = {'date': start.date().isoformat()}
+            event['end'] = {'date': (start.date() + datetime.timedelta(days=1)).isoformat()}
+
+        if self.random.random() < 0.3:
+            event['location'] = 'Room {0}'.format(number % 10)
+        if self.random.random() < 0.3:
+            # Invitations often carry long descriptions
+            paragraphs = self.random.randint(1, 40)
+            event['description'] = '<b>Agenda</b><br>' + ''.join(
+                '<p>Discuss item {0} of the meeting, with the notes of the previous one.</p>'.format(item)
+                for item in range(paragraphs))
+
+        if self.random.random() < 0.8:
+            event['attendees'] = [{
+                'email': calendar_id,
+                'self': True,
+                'responseStatus': self.random.choice(RESPONSE_STATUSES),
+                'optional': self.random.random() < 0.1,
+            }] + [{'email': 'guest{0}@benchmark.test'.format(guest), 'responseStatus': 'accepted'}
+                  for guest in range(self.random.randint(1, 10))]
+
+        if self.random.random() < 0.5:
+            code = 'abc-defg-{0:03d}'.format(number % 1000)
+            event['hangoutLink'] = 'https://meet.google.com/' + code
+            event['conferenceData'] = {
+                'entryPoints': [
+                    {'entryPointType': 'video', 'uri': 'https://meet.google.com/' + code,
+                     'label': 'meet.google.com/' + code},
+                    {'entryPointType': 'more', 'uri': 'https://tel.meet/' + code, 'pin': '123456'},
+                ],
+                'conferenceSolution': {
+                    'key': {'type': 'hangoutsMeet'},
+                    'name': 'Google Meet',
+                    'iconUri': self.url + 'icon.png',
+                },
+                'conferenceId': code,
+                'notes': 'Join from a computer with the link, or dial in with the phone number and the pin.',
+            }
+
+        return event
+
+    # Modify count timed events, they are listed again by the next sync
+    def mutate(self, count):
+        with self.lock:
+            self.version += 1
+            candidates = [(calendar_id, event_id) for calendar_id, events in self.events.items()
+                          for event_id, (_, event) in events.items() if 'dateTime' in event.get('start', {})]
+
+            for calendar_id, event_id in self.random.sample(candidates, min(count, len(candidates))):
+                event = dict(self.events[calendar_id][event_id][1])
+                event['etag'] = '"{0}"'.format(self.version)
+                event['summary'] += ' (updated)'
+                event['updated'] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+                self.events[calendar_id][event_id] = (self.version, event)
+
+    # Ids of the events the application should display for this window
+    def expected(self, time_min, time_max):
+        result = set()
+        for calendar in (calendar for calendar_list in self.calendar_lists for calendar in calendar_list):
+            if calendar['accessRole'] != 'owner':
+                continue
+
+            for _, event in self.listed(list(self.events[calendar['id']].values()), True):
+                if event['status'] == 'cancelled' or 'dateTime' not in event['start']:
+                    continue
+                if 'attendees' in event and event['attendees'][0].get('responseStatus') == 'declined':
+                    continue
+
+                if self.overlaps(event, time_min, time_max):
+                    result.add(event['id'])
+
+        return result
+
+    # Busy blocks of the calendar in the window, merged and in UTC
+    def busy_blocks(self, calendar_id, time_min, time_max):
+        with self.lock:
+            entries = list(self.events[calendar_id].values())
+        events = [event for _, event in self.listed(entries, True)]
+
+        intervals = []
+        for event in events:
+            if event['status'] == 'cancelled' or 'dateTime' not in event['start']:
+                continue
+            if 'attendees' in event and event['attendees'][0].get('responseStatus') == 'declined':
+                continue
+
+            start = max(time_min, parse_datetime(event['start']['dateTime']))
+            end = min(time_max, parse_datetime(event['end']['dateTime']))
+            if start < end:
+                intervals.append([start, end])
+
+        blocks = []
+        for start, end in sorted(intervals):
+            if blocks and start <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], end)
+            else:
+                blocks.append([start, end])
+
+        return [{'start': utc(start), 'end': utc(end)} for start, end in blocks]
+
+    def query_busy(self, body):
+        time_min = parse_datetime(body['timeMin'])
+        time_max = parse_datetime(body['timeMax'])
+
+        calendars = {}
+        for item in body.get('items', []):
+            if item['id'] in self.events:
+                calendars[item['id']] = {'busy': self.busy_blocks(item['id'], time_min, time_max)}
+            else:
+                calendars[item['id']] = {'errors': [{'domain': 'global', 'reason': 'notFound'}], 'busy': []}
+
+        return 200, {'kind': 'calendar#freeBusy', 'timeMin': body['timeMin'], 'timeMax': body['timeMax'],
+                     'calendars': calendars}
+
+    def list_calendars(self, account, query):
+        token = query.get('syncToken')
+        if token is not None and not token.startswith('calendars-'):
+            return 410, self.error(410, 'Sync token is no longer valid, a full sync is required.', 'fullSyncRequired')
+
+        # The calendar list never changes, a sync only returns an empty page
+        items = [] if token else self.calendar_lists[account]
+        return 200, self.page('calendar#calendarList', items, query, self.calendars_page_size,
+                              'calendars-{0}'.format(self.version))
+
+    def list_events(self, calendar_id, query):
+        if calendar_id not in self.events:
+            return 404, self.error(404, 'Not Found', 'notFound')
+
+        with self.lock:
+            events = sorted(self.events[calendar_id].values(), key=lambda item: item[1]['id'])
+        # Without singleEvents, the cancelled exceptions of the recurring events are listed too
+        single_events = query.get('singleEvents') == 'true'
+        events = self.listed(events, single_events)
+
+        token = query.get('syncToken')
+        if token is not None:
+            if not token.startswith('events-'):
+                return 410, self.error(410, 'Sync token is no longer valid, a full sync is required.',
+                                       'fullSyncRequired')
+
+            since = int(token.split('-')[1])
+            items = [event for version, event in events if version > since]
+        else:
+            time_min = parse_datetime(query['timeMin']) if 'timeMin' in query else None
+            time_max = parse_datetime(query['timeMax']) if 'timeMax' in query else None
+            items = [event for _, event in events if self.overlaps(event, time_min, time_max)
+                     and not (single_events and event['status'] == 'cancelled')]
+            # As Google does, the exceptions of the listed recurring events are listed wherever they are, the
+            # occurrences they replace may still be in the window: a cancelled one until the end of its occurrence
+            if not single_events:
+                recurring = set(event['id'] for event in items if 'recurrence' in event)
+                items += [event for _, event in events if event.get('recurringEventId') in recurring
+                          and not self.overlaps(event, time_min, time_max)]
+
+        max_attendees = int(query.get('maxAttendees', 0))
+        if max_attendees:
+            items = [self.limit_attendees(event, max_attendees) for event in items]
+
+        page = self.page('calendar#events', items, query, self.events_page_size, 'events-{0}'.format(self.version))
+        page.update({'summary': calendar_id, 'timeZone': 'UTC', 'accessRole': 'owner'})
+
+        return 200, page
+
+    def get_event(self, calendar_id, event_id):
+        with self.lock:
+            event = self.events.get(calendar_id, {}).get(event_id)
+            recurring = self.events.get(calendar_id, {}).get(event_id.rsplit('_', 1)[0])
+
+        # Instances of the recurring events are found by their id too
+        if event is None and recurring is not None and 'recurrence' in recurring[1]:
+            event = next(((recurring[0], instance) for instance in self.instances(recurring[1])
+                          if instance['id'] == event_id), None)
+
+        if event is None:
+            return 404, self.error(404, 'Not Found', 'notFound')
+
+        return 200, event[1]
+
+    def overlaps(self, event, time_min, time_max):
+        if 'recurrence' in event:
+            return any(self.overlaps(instance, time_min, time_max) for instance in self.instances(event))
+
+        # A cancelled exception is where the instance it removes was
+        if 'start' not in event:
+            event = {'start': event['originalStartTime'], 'end': event['originalStartTime']}
+
+        if 'dateTime' not in event['start']:
+            return True
+
+        if time_min is not None and parse_datetime(event['end']['dateTime']) <= time_min:
+            return False
+
+        return time_max is None or parse_datetime(event['start']['dateTime']) < time_max
+
+    @staticmethod
+    def limit_attendees(event, max_attendees):
+        if len(event.get('attendees', [])) <= max_attendees:
+            return event
+
+        event = dict(event)
+        event['attendees'] = event['attendees'][:max_attendees]
+        event['attendeesOmitted'] = True
+
+        return event
+
+    @staticmethod
+    def page(kind, items, query, page_size, sync_token):
+        page_size = min(page_size, int(query.get('maxResults', page_size)))
+        offset = int(query.get('pageToken', 0))
+
+        page = {'kind': kind, 'etag': '"p"', 'items': items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            page['nextPageToken'] = str(offset + page_size)
+        else:
+            page['nextSyncToken'] = sync_token
+
+        return page
+
+    @staticmethod
+    def error(code, message, reason):
+        return {'error': {'code': code, 'message': message, 'errors': [
+            {'domain': 'global', 'reason': reason, 'message': message}
+        ]}}
+
+    # Status, body and headers of an injected failure, None when the request is served
+    def failure(self):
+        with self.lock:
+            if self.outage:
+                status, reason = 503, 'backendError'
+            elif self.failure_rate and self.random.random() < self.failure_rate:
+                status, reason = self.random.choice(FAILURES)
+            else:
+                return None
+
+        headers = {'Retry-After': str(self.retry_after)} if status == 429 else {}
+        return status, self.error(status, 'Injected failure', reason), headers
+
+    def truncate(self):
+        with self.lock:
+            if self.truncated <= 0:
+                return False
+
+            self.truncated -= 1
+            return True
+
+    def count(self, name, size):
+        with self.lock:
+            self.requests[name] += 1
+            self.sent += size
+
+    def statistics(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'round_trips': sum(self.requests.values()), 'bytes': self.sent}
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    # Keep-alive, as googleapis.com does
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle would delay the body until the client acknowledges
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        if parts == ['icon.png']:
+            return self.send(200, ICON, 'image/png', 'icon')
+
+        if parts[:2] == ['calendar', 'v3']:
+            account = self.server.account(self.headers.get('Authorization'))
+            if account is None:
+                return self.send_json('unauthorized', 401, self.server.error(401, 'Invalid Credentials', 'authError'))
+
+            failure = self.server.failure()
+            if failure is not None:
+                return self.send_json('failure', failure[0], failure[1], headers=failure[2])
+
+            parts = parts[2:]
+            if parts == ['users', 'me', 'calendarList']:
+                return self.send_json('calendarList.list', *self.server.list_calendars(account, query), query)
+            if len(parts) == 3 and parts[0] == 'calendars' and parts[2] == 'events':
+                return self.send_json('events.list', *self.server.list_events(parts[1], query), query)
+            if len(parts) == 4 and parts[0] == 'calendars' and parts[2] == 'events':
+                return self.send_json('events.get', *self.server.get_event(parts[1], parts[3]), query)
+
+        self.send_json('unknown', 404, self.server.error(404, 'Not Found', 'notFound'))
+
+    def do_POST(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        if url.path == '/calendar/v3/freeBusy':
+            failure = self.server.failure()
+            if failure is not None:
+                return self.send_json('failure', failure[0], failure[1], headers=failure[2])
+
+            return self.send_json('freebusy.query', *self.server.query_busy(body), query)
+
+        self.send_json('unknown', 404, self.server.error(404, 'Not Found', 'notFound'))
+
+    def send_json(self, name, status, body, query=None, headers=None):
+        if query and 'fields' in query and status == 200:
+            body = project(body, parse_fields(query['fields']))
+
+        self.send(status, json.dumps(body).encode('utf-8'), 'application/json; charset=UTF-8', name, headers)
+
+    def send(self, status, data, content_type, name, headers=None):
+        # Google only compresses responses for clients with gzip in their user agent
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '') and 'gzip' in self.headers.get('User-Agent', '')
+        if compress and content_type.startswith('application/json'):
+            data = gzip.compress(data, 6)
+        else:
+            compress = False
+
+        self.server.count(name, len(data))
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+
+        if name != 'icon' and self.server.truncate():
+            self.close_connection = True
+            data = data[:len(data) // 2]
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
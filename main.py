@@ -1,11 +1,11 @@
 from __future__ import print_function
 
 import sys
+import time
 from os import path, environ, mkdir
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly',
           'https://www.googleapis.com/auth/calendar.events.readonly']
-DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
 NAME = 'Today Overview'
 
 if sys.platform == 'win32':
@@ -14,19 +14,29 @@ else:
     APPDATA = path.expanduser(path.join('~', '.' + NAME))
 
 if __name__ == '__main__':
+    started = time.perf_counter()
+
     from PyQt5.QtWidgets import QApplication
 
     from src.ui import Ui
+    from src.logger import setup_logging, stop_logging
     from src.utilities import except_hook
 
+    imported = time.perf_counter()
+
     sys.excepthook = except_hook
 
     if not path.exists(APPDATA):
         mkdir(APPDATA)
 
+    setup_logging()
+
     app = QApplication(sys.argv)
 
-    ui = Ui()
+    ui = Ui(started, imported)
     ui.show()
 
-    sys.exit(app.exec())
+    code = app.exec()
+    stop_logging()
+
+    sys.exit(code)
@@ -0,0 +1,93 @@
+import datetime
+import os
+from os import path
+
+from main import APPDATA, SCOPES
+from src.discovery import discovery_document
+from src.transport import metered_json_model, transport
+
+DEFAULT_ACCOUNT = 'default'
+ACCOUNTS_PATH = path.join(APPDATA, 'accounts')
+
+
+# A Google account: its token, credentials and Calendar service.
+# The default account keeps the token.json of the single account versions, the others are in ACCOUNTS_PATH.
+class Account:
+    def __init__(self, name=DEFAULT_ACCOUNT):
+        self.name = name
+        if name == DEFAULT_ACCOUNT:
+            self.token_path = path.join(APPDATA, 'token.json')
+        else:
+            self.token_path = path.join(ACCOUNTS_PATH, name + '.json')
+
+        self.credentials = None
+        self.service = None
+
+    # Key of a value of this account in the store meta
+    def key(self, name):
+        return '{0}:{1}'.format(self.name, name)
+
+    # Run on the api pool, or on the login pool for a new account which opens the login page of the browser.
+    # The login gives up after login_timeout seconds, None waits for it.
+    def authorize(self, login_timeout=None):
+        self.load_credentials(login_timeout)
+        self.build_service()
+
+    def build_service(self):
+        from googleapiclient.discovery import build_from_document
+
+        self.service = build_from_document(discovery_document(), http=transport.authorize(self.credentials, self.name),
+                                           model=metered_json_model())
+
+    def load_credentials(self, login_timeout=None):
+        from google.auth.exceptions import RefreshError
+        from google.oauth2.credentials import Credentials
+
+        if os.path.exists(self.token_path):
+            self.credentials = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+
+        if not self.credentials or not self.credentials.valid:
+            if self.credentials and self.credentials.expired and self.credentials.refresh_token:
+                try:
+                    self.credentials.refresh(transport.auth_request())
+                except RefreshError:
+                    os.remove(self.token_path)
+                    self.credentials = None
+                    return self.load_credentials(login_timeout)
+            else:
+                # Only needed on the first login
+                from google_auth_oauthlib.flow import InstalledAppFlow
+
+                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+                self.credentials = flow.run_local_server(port=0, timeout_seconds=login_timeout)
+
+            self.save_credentials()
+
+    def save_credentials(self):
+        if not path.exists(path.dirname(self.token_path)):
+            os.mkdir(path.dirname(self.token_path))
+
+        with open(self.token_path, 'w') as token:
+            token.write(self.credentials.to_json())
+
+    # Seconds before the token expires, None when unknown
+    def expires_in(self):
+        if self.credentials is None or self.credentials.expiry is None:
+            return None
+
+        # Expiry is a naive UTC date
+        return (self.credentials.expiry - datetime.datetime.utcnow()).total_seconds()
+
+    def refresh_credentials(self):
+        if self.credentials is None or not self.credentials.refresh_token:
+            return
+
+        self.credentials.refresh(transport.auth_request())
+        self.save_credentials()
+
+    def logout(self):
+        if os.path.exists(self.token_path):
+            os.remove(self.token_path)
+
+        self.credentials = None
+        self.service = None
@@ -0,0 +1,260 @@
+import datetime
+from webbrowser import open
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QUrl, QEvent
+from PyQt5.QtGui import QPainterPath, QFont, QDesktopServices, QCursor
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView, QToolTip, QFrame
+
+from src.record import countdown
+from src.theme import theme
+from src.tooltip import conference_tooltip, event_tooltip
+
+
+# Events of the list view, their countdown is kept up to date by the Ticker of Ui
+class AgendaModel(QAbstractListModel):
+    def __init__(self, parent):
+        super(AgendaModel, self).__init__(parent)
+
+        self.ui = parent
+        self.records = []
+        self.countdowns = {}
+        self.ended = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        return self.records[index.row()]
+
+    def set_records(self, records):
+        self.beginResetModel()
+        self.records = records
+        self.countdowns = {}
+        self.ended = set()
+        self.endResetModel()
+
+    # Same contract as Event.countdown
+    def countdown(self, now=None):
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+
+        interval = None
+        changed = []
+        for row, record in enumerate(self.records):
+            state, text, delay = countdown(record, now)
+            if state == 'ended':
+                if record.id in self.ended:
+                    continue
+
+                # The agenda is displayed again, the model is reset with the new records and already ticked
+                self.ended.add(record.id)
+                self.ui.event_ended()
+                return None
+
+            progress = int((now - record.start).total_seconds()) if state == 'in_progress' else None
+            value = (state, text, progress)
+            if self.countdowns.get(record.id) != value:
+                self.countdowns[record.id] = value
+                changed.append(row)
+
+            interval = delay if interval is None else min(interval, delay)
+
+        # Only the visible rows are painted again by the view
+        if changed:
+            # noinspection PyUnresolvedReferences
+            self.dataChanged.emit(self.index(changed[0]), self.index(changed[-1]))
+
+        return interval
+
+
+# Paint an event like the Event widget does, without any widget, in the colors of src.theme
+class EventDelegate(QStyledItemDelegate):
+    spacing = 15
+    band = 5
+    padding = 10
+    button_size = 36
+    card_height = band + padding + button_size + padding + band
+
+    def __init__(self, view, model, ui):
+        super(EventDelegate, self).__init__(view)
+
+        self.model = model
+        self.ui = ui
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.card_height + self.spacing)
+
+    # Rectangles of the card and of its parts, used to paint and to find what is under the mouse
+    def layout(self, rect, record):
+        card = QRect(rect.x(), rect.y(), rect.width(), self.card_height)
+        top = card.y() + self.band + self.padding
+        x = card.x() + self.padding
+
+        parts = {
+            'card': card,
+            'duration': QRect(x, top, 120, self.button_size),
+            'summary': QRect(x + 120, top, 200, self.button_size),
+            'conferences': [],
+            'countdown': QRect(card.right() - self.padding - 50, top, 50, self.button_size),
+        }
+
+        x += 320 + self.padding
+        for uri, label in record.entry_points:
+            parts['conferences'].append((QRect(x, top, self.button_size, self.button_size), uri, label))
+            x += self.button_size + self.padding
+
+        return parts
+
+    def paint(self, painter, option, index):
+        record = index.data()
+        parts = self.layout(option.rect, record)
+        card = parts['card']
+        state, text, progress = self.model.countdowns.get(record.id, ('upcoming', '', None))
+
+        painter.save()
+        painter.setRenderHint(painter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+
+        path = QPainterPath()
+        path.addRoundedRect(card.x(), card.y(), card.width(), card.height(), 5, 5)
+        painter.fillPath(path, theme.qcolor(theme.event_color(record.color_id, state)))
+
+        if record.response_status == 'needsAction':
+            painter.fillRect(QRect(card.x(), card.y(), card.width(), self.band), theme.qcolor(theme.needs_action))
+
+        if progress is not None:
+            seconds = max(1, (record.end - record.start).total_seconds())
+            width = int(card.width() * min(1, progress / seconds))
+            painter.fillRect(QRect(card.x(), card.bottom() - self.band + 1, width, self.band),
+                             option.palette.highlight())
+
+        painter.setPen(theme.qcolor(theme.text))
+        painter.setFont(option.font)
+        painter.drawText(parts['duration'], Qt.AlignVCenter | Qt.AlignLeft, record.duration)
+        painter.drawText(parts['countdown'], Qt.AlignVCenter | Qt.AlignRight, text)
+
+        prefix = ''
+        if record.optional:
+            prefix += '[optional]'
+        if record.response_status == 'tentative':
+            prefix += '[tentative]'
+        summary = (prefix + ' ' if prefix else '') + record.summary
+
+        font = QFont(option.font)
+        font.setBold(True)
+        font.setUnderline(True)
+        painter.setFont(font)
+        painter.setPen(theme.qcolor(theme.summary_color(record.color_id)))
+        rect = parts['summary']
+        painter.drawText(rect, Qt.AlignVCenter | Qt.AlignLeft,
+                         painter.fontMetrics().elidedText(summary, Qt.ElideRight, rect.width()))
+
+        painter.setFont(option.font)
+        for rect, uri, label in parts['conferences']:
+            button = QPainterPath()
+            button.addRoundedRect(rect.x(), rect.y(), rect.width(), rect.height(), 5, 5)
+            painter.fillPath(button, theme.qcolor(theme.primary))
+
+            icon = self.ui.icons.get(record.conference_icon)
+            if icon is None and record.conference_icon:
+                icon = self.ui.fetch_icon(record.conference_icon)
+
+            if icon:
+                icon.paint(painter, rect.adjusted(self.padding, self.padding, -self.padding, -self.padding))
+            else:
+                painter.setPen(theme.qcolor(theme.text))
+                painter.drawText(rect, Qt.AlignCenter, painter.fontMetrics().elidedText(label, Qt.ElideRight,
+                                                                                       rect.width()))
+
+        painter.restore()
+
+    # Part of the event under a position of the view: ('summary', record), ('conference', (record, uri)) or None
+    def hit(self, view, position):
+        index = view.indexAt(position)
+        if not index.isValid():
+            return None, None
+
+        record = index.data()
+        parts = self.layout(view.visualRect(index), record)
+        if parts['summary'].contains(position):
+            return 'summary', record
+
+        for rect, uri, _ in parts['conferences']:
+            if rect.contains(position):
+                return 'conference', (record, uri)
+
+        return None, None
+
+
+# Scrollable list only painting its visible events, used instead of Event widgets for long agendas
+class AgendaView(QListView):
+    preferred_width = 480
+
+    def __init__(self, ui):
+        super(AgendaView, self).__init__()
+
+        self.ui = ui
+        self.agenda_model = AgendaModel(ui)
+        self.delegate = EventDelegate(self, self.agenda_model, ui)
+
+        self.setModel(self.agenda_model)
+        self.setItemDelegate(self.delegate)
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setMouseTracking(True)
+
+        # noinspection PyUnresolvedReferences
+        self.ui.icon_loaded.connect(lambda uri: self.viewport().update())
+        # noinspection PyUnresolvedReferences
+        self.ui.details_loaded.connect(self.details_loaded)
+
+    def sizeHint(self):
+        content = self.agenda_model.rowCount() * (self.delegate.card_height + self.delegate.spacing)
+        available = self.ui.screen().availableSize().height() // 2
+
+        return QSize(self.preferred_width, max(self.delegate.card_height, min(content, available)))
+
+    def mouseMoveEvent(self, event):
+        part, _ = self.delegate.hit(self, event.pos())
+        self.viewport().setCursor(QCursor(Qt.PointingHandCursor if part else Qt.ArrowCursor))
+
+        super(AgendaView, self).mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            part, value = self.delegate.hit(self, event.pos())
+            if part == 'summary':
+                QDesktopServices.openUrl(QUrl(value.html_link))
+            elif part == 'conference':
+                open(value[1])
+
+        super(AgendaView, self).mouseReleaseEvent(event)
+
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip:
+            self.show_tooltip(event.globalPos())
+            return True
+
+        return super(AgendaView, self).viewportEvent(event)
+
+    def show_tooltip(self, position):
+        part, value = self.delegate.hit(self, self.viewport().mapFromGlobal(position))
+        if part == 'summary':
+            self.ui.load_details(value)
+            QToolTip.showText(position, '<qt>{0}</qt>'.format(event_tooltip(value)), self)
+        elif part == 'conference':
+            self.ui.load_details(value[0])
+            QToolTip.showText(position, '<qt>{0}</qt>'.format(conference_tooltip(value[0])), self)
+        else:
+            QToolTip.hideText()
+
+    def details_loaded(self, event_id):
+        if QToolTip.isVisible() and self.viewport().underMouse():
+            self.show_tooltip(QCursor.pos())
@@ -0,0 +1,103 @@
+from PyQt5.QtCore import Qt, QEvent, QRect, QSize
+from PyQt5.QtGui import QColor, QPainter
+from PyQt5.QtWidgets import QWidget, QToolTip
+
+from src.record import parse_datetime
+
+
+# Stored freebusy.query results, [{'id', 'summary', 'busy': [{'start', 'end'}]}], as (summary, [(start, end)])
+def busy_blocks(calendars):
+    return [(calendar['summary'], [(parse_datetime(block['start']), parse_datetime(block['end']))
+                                   for block in calendar['busy']]) for calendar in calendars]
+
+
+# Busy blocks of the busy-only calendars, one thin bar per calendar over the rest of the displayed window.
+# Everything is painted by this single widget, there is no widget per block.
+class BusyBars(QWidget):
+    label_width = 120
+    bar_width = 350
+    spacing = 4
+    color = QColor('#7986CB')
+    background = QColor('#E8EAF6')
+
+    def __init__(self, parent):
+        super(BusyBars, self).__init__(parent)
+
+        self.calendars = []
+        self.start = None
+        self.end = None
+
+        self.hide()
+
+    def set_busy(self, calendars, start, end):
+        self.calendars = calendars
+        self.start = start
+        self.end = end
+
+        self.setVisible(bool(calendars))
+        self.updateGeometry()
+        self.update()
+
+    def row_height(self):
+        return self.fontMetrics().height()
+
+    def sizeHint(self):
+        return QSize(self.label_width + self.bar_width,
+                     max(0, len(self.calendars) * (self.row_height() + self.spacing) - self.spacing))
+
+    # Called by the Ticker, the bars start at the current minute
+    def countdown(self, now):
+        self.start = now
+        self.update()
+
+        return 60 - now.second
+
+    def position(self, date):
+        width = self.width() - self.label_width
+        ratio = (date - self.start).total_seconds() / (self.end - self.start).total_seconds()
+
+        return self.label_width + int(width * min(1, max(0, ratio)))
+
+    def paintEvent(self, event):
+        if not self.calendars or self.end <= self.start:
+            return
+
+        painter = QPainter(self)
+        height = self.row_height()
+        for row, (summary, blocks) in enumerate(self.calendars):
+            top = row * (height + self.spacing)
+
+            text = self.fontMetrics().elidedText(summary, Qt.ElideRight, self.label_width - 10)
+            painter.drawText(QRect(0, top, self.label_width - 10, height), Qt.AlignLeft | Qt.AlignVCenter, text)
+
+            painter.fillRect(QRect(self.label_width, top, self.width() - self.label_width, height), self.background)
+            for start, end in blocks:
+                left = self.position(start)
+                right = self.position(end)
+                if right > left:
+                    painter.fillRect(QRect(left, top, right - left, height), self.color)
+
+    def block_at(self, position):
+        row = position.y() // (self.row_height() + self.spacing)
+        if row >= len(self.calendars) or position.x() < self.label_width or self.end <= self.start:
+            return None, None
+
+        summary, blocks = self.calendars[row]
+        for start, end in blocks:
+            if self.position(start) <= position.x() <= self.position(end):
+                return summary, (start, end)
+
+        return summary, None
+
+    def event(self, event):
+        if event.type() == QEvent.ToolTip:
+            summary, block = self.block_at(event.pos())
+            if block is None:
+                QToolTip.hideText()
+            else:
+                start, end = (date.astimezone() for date in block)
+                QToolTip.showText(event.globalPos(), '{0}: busy {1:%H:%M} - {2:%H:%M}'.format(summary, start, end),
+                                  self)
+            return True
+
+        return super(BusyBars, self).event(event)
@@ -0,0 +1,187 @@
+import email.utils
+import json
+import random
+import threading
+import time
+from collections import deque
+
+from src.logger import get_logger
+from src.metrics import metrics
+
+# Reasons of a 403 telling the quota is exhausted for now, the others are not retried
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+# Raised instead of sending a request while the API is considered down
+class CircuitOpenError(Exception):
+    def __init__(self, retry_in):
+        super(CircuitOpenError, self).__init__('Calendar API unavailable')
+
+        self.retry_in = retry_in
+
+
+# Requests allowed per sliding minute, shared by every account and refresh path. Callers wait for a slot.
+class RequestBudget:
+    interval = 60
+
+    def __init__(self, per_minute=600):
+        self.per_minute = per_minute
+        self.lock = threading.Lock()
+        self.sent = deque()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= self.interval:
+                    self.sent.popleft()
+
+                if len(self.sent) < self.per_minute:
+                    self.sent.append(now)
+                    return
+
+                wait = self.sent[0] + self.interval - now
+
+            metrics.count('api budget waits')
+            time.sleep(wait)
+
+
+# Opened after threshold failures in a row, the requests are then refused for cooldown seconds.
+# The first request after the cooldown is let through, it closes the circuit again if it succeeds.
+# The concurrent requests wait for its outcome instead of failing the refresh.
+class CircuitBreaker:
+    threshold = 5
+    cooldown = 60
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            while self.probing:
+                self.lock.wait()
+
+            if self.opened_at is None:
+                return
+
+            retry_in = self.opened_at + self.cooldown - time.monotonic()
+            if retry_in > 0:
+                raise CircuitOpenError(retry_in)
+
+            self.probing = True
+
+    def success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                get_logger('api').info('Calendar API available again')
+
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.lock.notify_all()
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            self.lock.notify_all()
+
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    metrics.count('api circuit opened')
+                    get_logger('api').warning('Calendar API unavailable after {0} failures'.format(self.failures))
+                self.opened_at = time.monotonic()
+
+
+# httplib2 compatible wrapper given to googleapiclient: every call of the services goes through the budget and the
+# circuit breaker, throttled and failed requests are retried with exponential backoff and full jitter.
+class ResilientHttp:
+    max_retries = 4
+    backoff = 1.0
+    max_backoff = 30.0
+    # A longer Retry-After is not waited for, the refresh fails and the agenda stays as it is
+    max_retry_after = 60.0
+
+    def __init__(self, http, budget, breaker):
+        self.http = http
+        self.budget = budget
+        self.breaker = breaker
+
+    def request(self, *args, **kwargs):
+        from requests import ConnectionError, Timeout
+
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            self.budget.acquire()
+
+            try:
+                response, content = self.http.request(*args, **kwargs)
+            except (ConnectionError, Timeout):
+                self.breaker.failure()
+                if attempt >= self.max_retries:
+                    raise
+
+                delay = self.delay(attempt)
+            except Exception:
+                # Not retried (token refresh failed offline, response cut short...), the probe must still end
+                self.breaker.failure()
+                raise
+            else:
+                if not self.retryable(response, content):
+                    self.breaker.success()
+                    return response, content
+
+                self.breaker.failure()
+                delay = self.delay(attempt, response.get('retry-after'))
+                if attempt >= self.max_retries or delay is None:
+                    return response, content
+
+            metrics.count('api retries')
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def retryable(response, content):
+        if response.status == 429 or response.status >= 500:
+            return True
+
+        if response.status != 403:
+            return False
+
+        try:
+            errors = json.loads(content)['error']['errors']
+        except (ValueError, TypeError, KeyError):
+            return False
+
+        return any(error.get('reason') in RATE_LIMIT_REASONS for error in errors)
+
+    # Seconds to wait before the next attempt, None when the server asks to wait too long
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is None:
+            return delay
+
+        try:
+            wait = float(retry_after)
+        except ValueError:
+            # Or an HTTP date
+            try:
+                wait = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError, AttributeError):
+                wait = 0
+
+        if wait > self.max_retry_after:
+            return None
+
+        return max(delay, wait)
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
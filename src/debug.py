@@ -0,0 +1,86 @@
+from html import escape
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QWidget, QLabel, QToolButton, QVBoxLayout, QHBoxLayout
+
+from src.metrics import metrics
+
+
+# Live view of the spans and counters of src.metrics, shown in the Header
+class DebugOverlay(QWidget):
+    interval = 1000
+    max_spans = 12
+
+    def __init__(self, parent):
+        super(DebugOverlay, self).__init__(parent)
+
+        self.setStyleSheet('QLabel { font-family: monospace; font-size: 11px; }')
+
+        self.label = QLabel(self)
+        self.label.setTextFormat(Qt.RichText)
+
+        self.status_label = QLabel(self)
+        self.status_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+
+        json_button = QToolButton(self)
+        json_button.setText('Export JSON')
+        json_button.clicked.connect(lambda: self.export(metrics.export_json))
+
+        trace_button = QToolButton(self)
+        trace_button.setText('Export trace')
+        trace_button.clicked.connect(lambda: self.export(metrics.export_trace))
+
+        reset_button = QToolButton(self)
+        reset_button.setText('Reset')
+        reset_button.clicked.connect(self.reset)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(json_button)
+        buttons_layout.addWidget(trace_button)
+        buttons_layout.addWidget(reset_button)
+        buttons_layout.addStretch()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.label)
+        layout.addLayout(buttons_layout)
+        layout.addWidget(self.status_label)
+
+        # Only updated while visible
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_metrics)
+
+    def showEvent(self, event):
+        self.update_metrics()
+        self.timer.start(self.interval)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+
+    def update_metrics(self):
+        snapshot = metrics.snapshot()
+
+        spans = sorted(snapshot['spans'].items(), key=lambda item: item[1]['total'], reverse=True)
+        text = '<table><tr><th align="left">Span</th><th>Count</th><th>Avg ms</th><th>Max ms</th><th>Total ms</th></tr>'
+        for name, span in spans[:self.max_spans]:
+            text += '<tr><td>{0}</td><td align="right">{1}</td><td align="right">{2:.1f}</td>' \
+                    '<td align="right">{3:.1f}</td><td align="right">{4:.0f}</td></tr>'.format(
+                        escape(name), span['count'], span['average'] * 1000, span['max'] * 1000, span['total'] * 1000)
+        text += '</table><br><table>'
+
+        for name, value in sorted(snapshot['counters'].items()):
+            text += '<tr><td>{0}</td><td align="right">{1}</td></tr>'.format(escape(name), value)
+        text += '</table>'
+
+        self.label.setText(text)
+
+    def export(self, export):
+        try:
+            self.status_label.setText('Exported to ' + export())
+        except OSError as exception:
+            self.status_label.setText('Export failed: {0}'.format(exception))
+
+    def reset(self):
+        metrics.reset()
+        self.update_metrics()
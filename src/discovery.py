@@ -0,0 +1,46 @@
+import os
+import time
+from os import path
+
+from main import APPDATA
+from src.transport import transport
+from src.utilities import handle_error
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest'
+DISCOVERY_PATH = path.join(APPDATA, 'calendar-v3.json')
+DISCOVERY_MAX_AGE = 7 * 24 * 3600
+
+
+# The discovery document is only downloaded when missing, building the service doesn't need the network then
+def discovery_document():
+    if not path.exists(DISCOVERY_PATH):
+        return download_discovery_document()
+
+    with open(DISCOVERY_PATH) as file:
+        return file.read()
+
+
+def download_discovery_document():
+    response = transport.get(DISCOVERY_URL)
+    response.raise_for_status()
+    document = response.text
+
+    temporary_path = DISCOVERY_PATH + '.tmp'
+    with open(temporary_path, 'w') as file:
+        file.write(document)
+    os.replace(temporary_path, DISCOVERY_PATH)
+
+    return document
+
+
+# The new version is used from the next launch
+def revalidate_discovery_document():
+    if not path.exists(DISCOVERY_PATH) or time.time() - path.getmtime(DISCOVERY_PATH) < DISCOVERY_MAX_AGE:
+        return
+
+    from requests import RequestException
+
+    try:
+        download_discovery_document()
+    except RequestException as exception:
+        handle_error(exception, 'discovery')
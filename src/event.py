@@ -1,13 +1,17 @@
 import datetime
 from webbrowser import open
 
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QUrl
+from PyQt5.QtCore import Qt, pyqtSignal, QUrl
 from PyQt5.QtGui import QDesktopServices, QCursor
-from PyQt5.QtWidgets import QWidget, QGraphicsDropShadowEffect, QHBoxLayout, QLabel, QPushButton, QVBoxLayout, \
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel, QPushButton, QVBoxLayout, \
     QProgressBar
 
-from main import DATETIME_FORMAT
-from src.utilities import clear_widget
+from src.metrics import metrics
+from src.record import countdown
+from src.shadow import drop_shadow_effect
+from src.theme import restyle
+from src.tooltip import LazyToolTip, conference_tooltip, event_tooltip
+from src.utilities import clear_layout, clear_widget
 
 
 class QLabelClickable(QLabel):
@@ -25,72 +29,81 @@ class QLabelClickable(QLabel):
 
 
 class Event(QWidget):
-    def __init__(self, parent, event):
+    def __init__(self, parent, record):
         super(Event, self).__init__()
 
         self.parent = parent
-        self.data = event
+        self.record = record
 
-        self.timer = None
         self.timer_label = None
-        self.start = None
-        self.end = None
-        self.responseStatus = None
 
-        self.classes = ['event']
-        self.optional = False
+        # upcoming or in_progress, the style only changes when the event moves from one to the other
+        self.state = None
         self.vertical_layout = None
         self.progress_bar = None
+        self.conference_buttons = []
+        self.tooltips = []
+        self.ended = False
 
-        self.setup_ui()
+        with metrics.span('Event.setup_ui'):
+            self.setup_ui()
+
+    def setup_ui(self):
+        self.setAttribute(Qt.WA_StyledBackground, True)
+
+        self.vertical_layout = QVBoxLayout()
+        self.vertical_layout.setContentsMargins(0, 5, 0, 0)
+        self.vertical_layout.setSpacing(0)
+        self.setLayout(self.vertical_layout)
+
+        self.setup_content()
+
+        self.parent.icon_loaded.connect(self.icon_loaded)
+        self.parent.details_loaded.connect(self.details_loaded)
+
+    # With the drop shadow effect, or without shadow when it is painted by the parent (see src.shadow) or disabled
+    def set_shadow(self, effect):
+        if effect and self.graphicsEffect() is None:
+            self.setGraphicsEffect(drop_shadow_effect())
+        elif not effect and self.graphicsEffect() is not None:
+            self.setGraphicsEffect(None)
+
+    # Keep the widget and its shadow, only the content is built again
+    def update_record(self, record):
+        self.record = record
+
+        clear_layout(self.vertical_layout)
+        self.timer_label = None
+        self.state = None
+        self.progress_bar = None
+        self.conference_buttons = []
+        self.tooltips = []
+        self.ended = False
+
+        self.setup_content()
+
+        restyle(self)
 
-    # TODO: Use google event data to style the ui (colors, transparency, visibility)
     # TODO: Let user customize which information to show
     # TODO: When printing email or name if it is the current user, display a custom string like "You" instead
     # TODO: Do something with attachments?
     # TODO: Do something with attendees? (idea: button, fetch list onclick)
-    def setup_ui(self):
-        if 'attendees' in self.data and self.data['attendees'][0]:
-            you = self.data['attendees'][0]
-            if 'responseStatus' in you:
-                self.responseStatus = you['responseStatus']
-                self.classes.append(self.responseStatus)
-
-            if 'optional' in you and you['optional']:
-                self.optional = True
-                self.classes.append('optional')
+    def setup_content(self):
+        classes = ['event']
+        if self.record.response_status:
+            classes.append(self.record.response_status)
 
-        self.setProperty('class', ' '.join(self.classes))
+        if self.record.optional:
+            classes.append('optional')
 
-        self.setAttribute(Qt.WA_StyledBackground, True)
-
-        shadow = QGraphicsDropShadowEffect()
-        shadow.setBlurRadius(15)
-        shadow.setXOffset(0)
-        shadow.setYOffset(2)
-        self.setGraphicsEffect(shadow)
+        self.setProperty('class', ' '.join(classes))
+        self.setProperty('color', self.record.color_id or '')
 
-        self.vertical_layout = QVBoxLayout()
-        self.vertical_layout.setContentsMargins(0, 5, 0, 0)
-        self.vertical_layout.setSpacing(0)
         horizontal_layout = QHBoxLayout()
         horizontal_layout.setContentsMargins(10, 10, 10, 10)
         self.vertical_layout.addLayout(horizontal_layout)
 
-        self.start = datetime.datetime.strptime(self.data['start']['dateTime'], DATETIME_FORMAT)
-        self.end = datetime.datetime.strptime(self.data['end']['dateTime'], DATETIME_FORMAT)
-        seconds = (self.end - self.start).total_seconds()
-        delta = ''
-        if seconds >= 3600:
-            hours = int(seconds // 3600)
-            seconds -= hours * 3600
-            delta = '{0}h'.format(hours)
-
-        if seconds >= 60:
-            minutes = int((seconds // 60) % 60)
-            delta += '{0}m'.format(minutes)
-
-        duration = QLabel('%s - %s (%s)' % (self.start.strftime("%H:%M"), self.end.strftime("%H:%M"), delta))
+        duration = QLabel(self.record.duration)
         duration.setMinimumWidth(120)
         horizontal_layout.addWidget(duration)
 
@@ -103,164 +116,109 @@ class Event(QWidget):
         self.countdown()
         horizontal_layout.addWidget(self.timer_label)
 
-        self.setLayout(self.vertical_layout)
-
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.timeout)
-        self.timer.start(1000)
-
     def open_link(self):
-        QDesktopServices.openUrl(QUrl(self.data['htmlLink']))
+        QDesktopServices.openUrl(QUrl(self.record.html_link))
 
-    # TODO: Display pretty date
     def setup_summary(self, layout):
         # TODO: Add to the QLabel an ellipsis when text is too long
 
         text = ''
-        if self.optional:
+        if self.record.optional:
             text += '[optional]'
 
-        if self.responseStatus == 'tentative':
+        if self.record.response_status == 'tentative':
             text += '[tentative]'
 
         if len(text):
             text += ' '
-        text += self.data['summary']
+        text += self.record.summary
         summary = QLabelClickable(text)
         # noinspection PyUnresolvedReferences
         summary.clicked.connect(self.open_link)
 
-        if 'organizer' in self.data:
-            text += '\n\nOrganizer:'
-            if 'displayName' in self.data['organizer']:
-                text += ' "{0}"'.format(self.data['organizer']['displayName'])
-
-            if 'email' in self.data['organizer']:
-                text += ' <{0}>'.format(self.data['organizer']['email'])
-
-        if 'location' in self.data:
-            text += '\nLocation: ' + self.data['location']
-
-        # TODO: Handle HTML inside description
-        if 'description' in self.data:
-            text += '\nDescription: ' + self.data['description']
-
-        event_type_text = {
-            'default': 'Regular',
-            'outOfOffice': 'Out-of-office',
-        }
-        text += '\n\nEvent type: ' + event_type_text[self.data['eventType']]
-
-        text += '\nOptional: ' + str(self.optional)
-
-        text += '\nResponse status: '
-        if self.responseStatus is None:
-            text += 'Unknown'
-        else:
-            text += self.responseStatus
-
-        text += '\nCreated at: ' + self.data['created']
-        if 'creator' in self.data:
-            text += ' By'
-            if 'displayName' in self.data['creator']:
-                text += ' "{0}"'.format(self.data['creator']['displayName'])
-
-            if 'email' in self.data['creator']:
-                text += ' <{0}>'.format(self.data['creator']['email'])
-        text += '\nLast modification: ' + self.data['updated']
-
-        summary.setToolTip(text)
+        self.tooltips.append(LazyToolTip(summary, lambda: self.tooltip(event_tooltip)))
         summary.setOpenExternalLinks(True)
         summary.setFixedWidth(200)
         layout.addWidget(summary)
 
-    # TODO: Handle more type of conference (phone, sip, more)
     # TODO: Fix the alignment (When row contain conference and others don't)
     def setup_conference(self, layout):
-        if 'conferenceData' not in self.data:
-            return
-
-        conference_data = self.data['conferenceData']
-        conference_data_solution = conference_data['conferenceSolution']
-        for entrypoint in conference_data['entryPoints']:
-            if entrypoint['entryPointType'] != 'video':
-                continue
-
+        for uri, label in self.record.entry_points:
             conference = QPushButton()
             conference.setProperty('class', 'video')
-            uri = entrypoint['uri']
-            conference.clicked.connect(lambda: open(uri))
+            conference.clicked.connect(lambda checked=False, uri=uri: open(uri))
 
-            icon = self.parent.fetch_icon(conference_data_solution['iconUri'])
-            tooltip = conference_data_solution['name']
-            label = tooltip
-            if 'label' in entrypoint and not uri.endswith(entrypoint['label']):
-                label = entrypoint['label']
-
-            text = ''
+            icon = self.parent.fetch_icon(self.record.conference_icon) if self.record.conference_icon else None
             if icon:
-                conference.setProperty('iconOnly', 'True')
-                conference.setIcon(icon)
+                self.set_conference_icon(conference, icon)
             else:
-                text = label
-
-            conference.setText(text)
+                conference.setText(label)
+                self.conference_buttons.append((conference, self.record.conference_icon))
 
-            # TODO: Handle HTML in tooltip
-            if 'notes' in conference_data:
-                tooltip += '\n\nNotes: {0}'.format(conference_data['notes'])
-            conference.setToolTip(tooltip)
+            self.tooltips.append(LazyToolTip(conference, lambda: self.tooltip(conference_tooltip)))
 
             layout.addWidget(conference)
 
-    def timeout(self):
-        self.countdown()
+    # The details of the event are loaded the first time one of its tooltips is shown
+    def tooltip(self, build):
+        self.parent.load_details(self.record)
 
-    def started(self, seconds):
-        self.classes.append('in_progress')
+        return build(self.record)
 
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setFixedHeight(5)
-        self.progress_bar.setTextVisible(False)
-        self.progress_bar.setRange(0, seconds)
-        self.vertical_layout.addWidget(self.progress_bar)
+    def details_loaded(self, event_id):
+        if event_id == self.record.id:
+            for tooltip in self.tooltips:
+                tooltip.refresh()
 
-    # TODO: Add ui effects for countdown close to end (maybe use Google event data reminders)
-    # TODO: Start timer inside countdown and update timer trigger duration their
-    def countdown(self):
-        now = datetime.datetime.now()
-        now = now.astimezone(self.start.tzinfo)
-
-        count_from = self.start
-        if now > self.start:
-            if now > self.end:
-                clear_widget(self)
-                self.parent.refresh()
-                return
-            else:
-                count_from = self.end
+    def icon_loaded(self, uri):
+        for conference, icon_uri in self.conference_buttons:
+            if icon_uri == uri:
+                self.set_conference_icon(conference, self.parent.icons[uri])
+
+    @staticmethod
+    def set_conference_icon(conference, icon):
+        conference.setProperty('iconOnly', 'True')
+        conference.setIcon(icon)
+        conference.setText('')
+        restyle(conference)
 
-                if 'in_progress' not in self.classes:
-                    self.started((self.end - self.start).total_seconds())
+    # Only called when the event is displayed and when it starts, the style is computed again
+    def set_state(self, state):
+        self.state = state
+        self.setProperty('state', state)
 
-                self.progress_bar.setValue((now - self.start).total_seconds())
+        if state == 'in_progress':
+            self.progress_bar = QProgressBar()
+            self.progress_bar.setFixedHeight(5)
+            self.progress_bar.setTextVisible(False)
+            self.progress_bar.setRange(0, int((self.record.end - self.record.start).total_seconds()))
+            self.vertical_layout.addWidget(self.progress_bar)
+
+        restyle(self)
+
+    # Called by the Ticker of the parent, return in how many seconds the countdown text changes
+    # TODO: Add ui effects for countdown close to end (maybe use Google event data reminders)
+    def countdown(self, now=None):
+        if self.ended:
+            return None
 
-        self.setProperty('class', ' '.join(self.classes))
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
 
-        seconds = (count_from - now).total_seconds()
+        state, text, delay = countdown(self.record, now)
+        if state == 'ended':
+            self.ended = True
+            clear_widget(self)
+            self.parent.event_ended()
+            return None
 
-        result = ''
-        if seconds >= 3600:
-            hours = int(seconds // 3600)
-            seconds -= hours * 3600
-            result = '{0}h'.format(hours)
+        if state != self.state:
+            self.set_state(state)
 
-        if seconds >= 60:
-            minutes = int((seconds // 60) % 60)
-            seconds -= minutes * 60
-            result += '{0}m'.format(minutes)
+        if state == 'in_progress':
+            self.progress_bar.setValue(int((now - self.record.start).total_seconds()))
 
-        if len(result) == 0:
-            result = '{0}s'.format(int(seconds))
+        if self.timer_label.text() != text:
+            self.timer_label.setText(text)
 
-        self.timer_label.setText(result)
+        return delay
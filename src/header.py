@@ -1,37 +1,24 @@
 import qtawesome
 from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QWidget, QToolButton, QLabel, QHBoxLayout
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import QWidget, QToolButton, QLabel, QHBoxLayout, QVBoxLayout, QShortcut
 
 from main import NAME
+from src.debug import DebugOverlay
 
 
 class Header(QWidget):
     icon = 'fa5s.window-close'
 
     parent = None
+    debug_overlay = None
 
     def __init__(self, parent):
         super(QWidget, self).__init__()
 
+        # Styled by the stylesheet of the parent, see src.theme
         self.parent = parent
 
-        css = """
-        QWidget {
-            height: 20px;
-            padding: 5px;
-            color: white;
-            background-color: #3949AB;
-        }
-        QToolButton {
-            background-color: #3949AB;
-            color: white;
-        }
-        QToolButton:hover {
-            background-color: #5C6BC0;
-        }
-        """
-        self.setStyleSheet(css)
-
         close_button = QToolButton(self)
         close_button.setIcon(qtawesome.icon('fa5s.window-close', color='white'))
         close_button.setMinimumHeight(10)
@@ -42,11 +29,27 @@ class Header(QWidget):
         self.parent.setWindowTitle(NAME)
         self.parent.setWindowIcon(qtawesome.icon(self.icon))
 
-        layout = QHBoxLayout(self)
+        title_layout = QHBoxLayout()
+        title_layout.setSpacing(0)
+        title_layout.setContentsMargins(0, 0, 0, 0)
+        title_layout.addWidget(title_label)
+        title_layout.addWidget(close_button)
+
+        self.debug_overlay = DebugOverlay(self)
+        self.debug_overlay.setVisible(self.parent.settings.value('debug', False, bool))
+        QShortcut(QKeySequence('Ctrl+Shift+D'), self.parent, self.toggle_debug)
+
+        layout = QVBoxLayout(self)
         layout.setSpacing(0)
         layout.setContentsMargins(0, 0, 0, 0)
-        layout.addWidget(title_label)
-        layout.addWidget(close_button)
+        layout.addLayout(title_layout)
+        layout.addWidget(self.debug_overlay)
+
+    def toggle_debug(self):
+        visible = not self.debug_overlay.isVisible()
+        self.debug_overlay.setVisible(visible)
+        self.parent.settings.setValue('debug', visible)
+        self.parent.refresh_size()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
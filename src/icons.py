@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from os import path
+
+from main import APPDATA
+from src.metrics import metrics
+from src.transport import transport
+from src.utilities import handle_error
+
+
+# Icons stored on drive by uri, least recently used ones are evicted when the cache is too big.
+# Uris failing to download are not tried again until their backoff delay is over.
+class IconCache:
+    directory = path.join(APPDATA, 'icons')
+    index_path = path.join(directory, 'index.json')
+
+    max_size = 5 * 1024 * 1024
+    max_age = 7 * 24 * 3600
+    backoff = 60
+    max_backoff = 24 * 3600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if not path.exists(self.directory):
+            os.mkdir(self.directory)
+
+        self.load()
+
+    # Run on a worker, return the icon data or None when not available
+    def fetch(self, uri):
+        with metrics.span('fetch_icon', uri=uri):
+            now = time.time()
+
+            with self.lock:
+                entry = self.entries.get(uri)
+                if entry is not None:
+                    entry['used'] = now
+
+                    if now < entry.get('retry_at', 0) or now - entry.get('checked', 0) < self.max_age:
+                        metrics.count('icon disk hits')
+                        return self.read(entry)
+
+            headers = {}
+            if entry is not None and 'file' in entry:
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+            from requests import RequestException
+
+            try:
+                response = transport.get(uri, headers)
+                if response.status_code == 304:
+                    metrics.count('icon revalidations')
+                    return self.revalidated(uri, now)
+
+                response.raise_for_status()
+                data = response.content
+            except RequestException as exception:
+                return self.failed(uri, now, exception)
+
+            metrics.count('icon downloads')
+            return self.store(uri, now, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    def read(self, entry):
+        if 'file' not in entry:
+            return None
+
+        try:
+            with open(path.join(self.directory, entry['file']), 'rb') as file:
+                return file.read()
+        except OSError:
+            entry['checked'] = 0
+            return None
+
+    def revalidated(self, uri, now):
+        with self.lock:
+            entry = self.entries[uri]
+            entry['checked'] = now
+            entry.pop('failures', None)
+            entry.pop('retry_at', None)
+            self.save()
+
+            return self.read(entry)
+
+    def failed(self, uri, now, exception):
+        handle_error(exception, 'icons', '{0}: {1}'.format(uri, exception))
+
+        with self.lock:
+            entry = self.entries.setdefault(uri, {'used': now})
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['retry_at'] = now + min(self.backoff * 2 ** (entry['failures'] - 1), self.max_backoff)
+            self.save()
+
+            # The previous version is still better than nothing
+            return self.read(entry)
+
+    def store(self, uri, now, data, etag, last_modified):
+        file_name = hashlib.sha1(uri.encode('utf-8')).hexdigest()
+        with open(path.join(self.directory, file_name), 'wb') as file:
+            file.write(data)
+
+        with self.lock:
+            self.entries[uri] = {
+                'file': file_name,
+                'size': len(data),
+                'etag': etag,
+                'last_modified': last_modified,
+                'checked': now,
+                'used': now,
+            }
+
+            self.evict()
+            self.save()
+
+        return data
+
+    def evict(self):
+        size = sum(entry.get('size', 0) for entry in self.entries.values())
+        for uri, entry in sorted(self.entries.items(), key=lambda item: item[1]['used']):
+            if size <= self.max_size:
+                break
+
+            if 'file' in entry:
+                size -= entry['size']
+                try:
+                    os.remove(path.join(self.directory, entry['file']))
+                except OSError:
+                    pass
+
+                del self.entries[uri]
+
+    def load(self):
+        if not path.exists(self.index_path):
+            return
+
+        try:
+            with open(self.index_path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.entries, file)
+        os.replace(temporary_path, self.index_path)
@@ -0,0 +1,135 @@
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from os import path
+
+from main import APPDATA
+
+LOGGER = 'today_overview'
+ERRORS_PATH = path.join(APPDATA, 'errors.log')
+CRASH_PATH = path.join(APPDATA, 'crash.log')
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+
+listener = None
+
+
+# One JSON object per line, formatted on the calling thread as the traceback can't be formatted later
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'subsystem': record.name[len(LOGGER) + 1:] or 'app',
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+
+        if record.exc_info:
+            data['exception'] = record.exc_info[0].__name__
+            data['traceback'] = self.formatException(record.exc_info)
+
+        for name in ('repeated', 'dropped'):
+            if getattr(record, name, 0):
+                data[name] = getattr(record, name)
+
+        return json.dumps(data)
+
+
+# The same message is logged once per interval, the next record tells how many times it was repeated meanwhile.
+# Bursts of different messages are limited to rate records per second, crashes are always logged.
+class RateLimitFilter(logging.Filter):
+    interval = 3600
+    rate = 5
+    burst = 20
+    max_messages = 1000
+
+    def __init__(self):
+        super(RateLimitFilter, self).__init__()
+
+        self.lock = threading.Lock()
+        # By (subsystem, message, exception type): [last logged at, repeated since]
+        self.messages = {}
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.getMessage(), record.exc_info[0] if record.exc_info else None)
+
+        with self.lock:
+            message = self.messages.get(key)
+            if message is not None and now - message[0] < self.interval:
+                message[1] += 1
+                return False
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.dropped += 1
+                return False
+            self.tokens -= 1
+
+            record.repeated = message[1] if message is not None else 0
+            record.dropped = self.dropped
+            self.dropped = 0
+
+            if len(self.messages) >= self.max_messages:
+                self.messages = {key: message for key, message in self.messages.items()
+                                 if now - message[0] < self.interval}
+            self.messages[key] = [now, 0]
+
+        return True
+
+
+def file_handler(file_path):
+    handler = RotatingFileHandler(file_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8', delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    return handler
+
+
+# Records are written by a background thread, errors.log gets everything and crash.log only the crashes
+def setup_logging():
+    global listener
+
+    if listener is not None:
+        return
+
+    crash_handler = file_handler(CRASH_PATH)
+    crash_handler.addFilter(logging.Filter(LOGGER + '.crash'))
+
+    records = queue.Queue()
+    listener = QueueListener(records, file_handler(ERRORS_PATH), crash_handler)
+    listener.start()
+
+    handler = QueueHandler(records)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(RateLimitFilter())
+
+    logger = logging.getLogger(LOGGER)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+
+# Write the records still queued, called before exiting
+def stop_logging():
+    global listener
+
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def get_logger(subsystem):
+    return logging.getLogger('{0}.{1}'.format(LOGGER, subsystem))
@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from os import path
+
+from main import APPDATA
+
+
+# Timing spans and counters of the refresh and render hot paths.
+# They are shown by the debug overlay of the Header, and exported to diagnose a slow refresh without a profiler.
+class Metrics:
+    # Only the last spans are kept for the trace, the totals cover the whole session
+    max_spans = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.counters = Counter()
+        # By name: [count, total duration, max duration]
+        self.totals = {}
+        self.spans = deque(maxlen=self.max_spans)
+        self.threads = {}
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter() - start, args)
+
+    def add_span(self, name, start, duration, args=None):
+        thread = threading.current_thread()
+
+        with self.lock:
+            total = self.totals.get(name)
+            if total is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                total[0] += 1
+                total[1] += duration
+                total[2] = max(total[2], duration)
+
+            self.threads[thread.ident] = thread.name
+            self.spans.append((name, thread.ident, start, duration, args))
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'uptime': time.perf_counter() - self.origin,
+                'spans': {name: {'count': count, 'total': total, 'average': total / count, 'max': maximum}
+                          for name, (count, total, maximum) in self.totals.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.totals.clear()
+            self.spans.clear()
+
+    @staticmethod
+    def export_path(name):
+        now = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return path.join(APPDATA, '{0}-{1}.json'.format(name, now))
+
+    def export_json(self, file_path=None):
+        file_path = file_path or self.export_path('metrics')
+        with open(file_path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+        return file_path
+
+    # Trace Event Format, opened by chrome://tracing and https://ui.perfetto.dev
+    def export_trace(self, file_path=None):
+        pid = os.getpid()
+
+        with self.lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                      for tid, name in self.threads.items()]
+            for name, tid, start, duration, args in self.spans:
+                events.append({
+                    'name': name,
+                    'ph': 'X',
+                    'pid': pid,
+                    'tid': tid,
+                    'ts': int((start - self.origin) * 1000000),
+                    'dur': int(duration * 1000000),
+                    'args': args or {},
+                })
+            now = int((time.perf_counter() - self.origin) * 1000000)
+            events.extend({'name': name, 'ph': 'C', 'pid': pid, 'ts': now, 'args': {'value': value}}
+                          for name, value in self.counters.items())
+
+        file_path = file_path or self.export_path('trace')
+        with open(file_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+        return file_path
+
+
+# Count the calls and the received bytes of an httplib2 compatible object
+class MeteredHttp:
+    def __init__(self, http, name='api'):
+        self.http = http
+        self.name = name
+
+    def request(self, *args, **kwargs):
+        response, content = self.http.request(*args, **kwargs)
+
+        metrics.count(self.name + ' calls')
+        metrics.count(self.name + ' bytes received', len(content or b''))
+
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+metrics = Metrics()
@@ -0,0 +1,146 @@
+import datetime
+
+# Fields of an API event read by each feature, events.list only asks for the fields of the features in use
+FEATURE_FIELDS = {
+    'agenda': 'id,iCalUID,etag,status,summary,htmlLink,colorId,start,end,attendees(self,responseStatus,optional)',
+    'conference': 'conferenceData(conferenceSolution(name,iconUri),entryPoints(entryPointType,uri,label))',
+    'tooltip': 'eventType,created,updated,location,organizer(email,displayName),creator(email,displayName)',
+    'recurrence': 'recurrence,recurringEventId,originalStartTime',
+}
+
+# Long texts only shown by the tooltips, requested for one event when one of its tooltips is shown
+DETAIL_FIELDS = 'etag,description,conferenceData/notes'
+
+
+def events_fields(features):
+    return 'nextPageToken,nextSyncToken,items({0})'.format(','.join(FEATURE_FIELDS[feature] for feature in features))
+
+
+# datetime.fromisoformat is much faster than strptime but only knows the Z suffix since Python 3.11
+def parse_datetime(value):
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+
+    return datetime.datetime.fromisoformat(value)
+
+
+def format_duration(seconds, show_seconds=False):
+    result = ''
+    if seconds >= 3600:
+        hours = int(seconds // 3600)
+        seconds -= hours * 3600
+        result = '{0}h'.format(hours)
+
+    if seconds >= 60:
+        minutes = int((seconds // 60) % 60)
+        seconds -= minutes * 60
+        result += '{0}m'.format(minutes)
+
+    if show_seconds and len(result) == 0:
+        result = '{0}s'.format(int(seconds))
+
+    return result
+
+
+# State of the event at now, its countdown text and in how many seconds this text changes
+def countdown(record, now):
+    if now > record.end:
+        return 'ended', '', None
+
+    if now > record.start:
+        state = 'in_progress'
+        seconds = (record.end - now).total_seconds()
+    else:
+        state = 'upcoming'
+        seconds = (record.start - now).total_seconds()
+
+    # Hours and minutes change on minute boundaries of the countdown, seconds are only shown in the last minute
+    if seconds >= 60:
+        delay = seconds % 60
+    else:
+        delay = seconds % 1
+
+    return state, format_duration(seconds, show_seconds=True), delay + 0.01
+
+
+# What the widgets need from an API event, parsed once when the event is received
+class EventRecord:
+    __slots__ = (
+        'id', 'account', 'calendar_id', 'ical_uid', 'etag', 'summary', 'html_link', 'color_id', 'start', 'end',
+        'duration', 'response_status', 'optional',
+        'organizer', 'creator', 'location', 'description', 'event_type', 'created', 'updated',
+        'conference_name', 'conference_icon', 'conference_notes', 'entry_points',
+        'details', 'tooltip', 'conference_tooltip',
+    )
+
+    # details tells if the item has the DETAIL_FIELDS, they are added later by add_details otherwise
+    def __init__(self, item, calendar_id=None, details=True, account=None):
+        self.id = item['id']
+        self.account = account
+        self.calendar_id = calendar_id
+        self.ical_uid = item.get('iCalUID')
+        self.details = details
+        self.etag = item.get('etag')
+        self.summary = item.get('summary', '(No title)')
+        self.html_link = item.get('htmlLink')
+        # See src.theme
+        self.color_id = item.get('colorId')
+
+        self.start = parse_datetime(item['start']['dateTime'])
+        self.end = parse_datetime(item['end']['dateTime'])
+        # Shown in the local timezone, whatever the timezone of the event
+        self.duration = '%s - %s (%s)' % (self.start.astimezone().strftime('%H:%M'),
+                                          self.end.astimezone().strftime('%H:%M'),
+                                          format_duration((self.end - self.start).total_seconds()))
+
+        self.response_status = None
+        self.optional = False
+        if 'attendees' in item and item['attendees'][0]:
+            you = item['attendees'][0]
+            self.response_status = you.get('responseStatus')
+            self.optional = you.get('optional', False)
+
+        self.organizer = item.get('organizer')
+        self.creator = item.get('creator')
+        self.location = item.get('location')
+        self.description = item.get('description')
+        self.event_type = item.get('eventType', 'default')
+        self.created = item.get('created')
+        self.updated = item.get('updated')
+
+        # Built on the first hover, see src.tooltip
+        self.tooltip = None
+        self.conference_tooltip = None
+
+        self.conference_name = None
+        self.conference_icon = None
+        self.conference_notes = None
+        self.entry_points = ()
+        if 'conferenceData' in item:
+            conference_data = item['conferenceData']
+            solution = conference_data.get('conferenceSolution', {})
+            self.conference_name = solution.get('name')
+            self.conference_icon = solution.get('iconUri')
+            self.conference_notes = conference_data.get('notes')
+
+            # TODO: Handle more type of conference (phone, sip, more)
+            entry_points = []
+            for entrypoint in conference_data.get('entryPoints', []):
+                if entrypoint['entryPointType'] != 'video':
+                    continue
+
+                uri = entrypoint['uri']
+                label = self.conference_name
+                if 'label' in entrypoint and not uri.endswith(entrypoint['label']):
+                    label = entrypoint['label']
+
+                entry_points.append((uri, label))
+            self.entry_points = tuple(entry_points)
+
+    def add_details(self, item):
+        self.description = item.get('description')
+        self.conference_notes = item.get('conferenceData', {}).get('notes')
+        self.details = True
+
+        self.tooltip = None
+        self.conference_tooltip = None
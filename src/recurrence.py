@@ -0,0 +1,278 @@
+import calendar
+import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from src.record import parse_datetime
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+# Parts of the rules expanded locally, the ones Google Calendar creates
+RULE_PARTS = ('FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY', 'BYMONTHDAY', 'BYMONTH', 'BYSETPOS', 'WKST')
+# End of the recurring events without end
+FOREVER = datetime.datetime(9999, 12, 31, tzinfo=datetime.timezone.utc)
+# Rules are not expanded further than this from the start of their event
+MAX_YEARS = 100
+
+
+# Timezone of the name, the default one without timezone database (Windows without the tzdata package):
+# the occurrences then keep the UTC offset of the first one across daylight saving time changes
+def timezone(name, default):
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+
+    return default
+
+
+# 'EXDATE;TZID=Europe/Paris:20211018T090000' as ('EXDATE', {'TZID': 'Europe/Paris'}, '20211018T090000')
+def parse_line(line):
+    head, _, value = line.partition(':')
+    name, *parameters = head.split(';')
+
+    return name.upper(), dict(parameter.split('=', 1) for parameter in parameters), value
+
+
+# 20211018T070000Z, 20211018T090000 in the timezone, or 20211018 at the time
+def parse_ical_datetime(value, tz, time):
+    if 'T' not in value:
+        return datetime.datetime.combine(datetime.datetime.strptime(value, '%Y%m%d').date(), time, tzinfo=tz)
+
+    if value.endswith('Z'):
+        return datetime.datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=datetime.timezone.utc)
+
+    return datetime.datetime.strptime(value, '%Y%m%dT%H%M%S').replace(tzinfo=tz)
+
+
+# Item of the list at the BYDAY or BYSETPOS position, counted from the end when negative
+def select(items, position):
+    if position is None:
+        return items
+
+    index = position - 1 if position > 0 else position
+    return [items[index]] if -len(items) <= index < len(items) else []
+
+
+# An RRULE, its dates are generated period by period: each day, week, month or year of the interval
+class Rule:
+    def __init__(self, value, start):
+        parts = dict(part.split('=', 1) for part in value.upper().split(';') if part)
+        if parts.get('FREQ') not in FREQUENCIES or any(name not in RULE_PARTS for name in parts):
+            raise ValueError('Unsupported recurrence rule {0}'.format(value))
+
+        def numbers(name):
+            return [int(number) for number in parts[name].split(',')] if name in parts else []
+
+        self.start = start
+        self.frequency = parts['FREQ']
+        self.interval = max(1, int(parts.get('INTERVAL', 1)))
+        self.count = int(parts['COUNT']) if 'COUNT' in parts else None
+        self.until = None
+        if 'UNTIL' in parts:
+            self.until = parse_ical_datetime(parts['UNTIL'], start.tzinfo, datetime.time.max)
+        # (position or None, weekday)
+        self.days = [(int(day[:-2]) if day[:-2] else None, WEEKDAYS.index(day[-2:]))
+                     for day in parts['BYDAY'].split(',')] if 'BYDAY' in parts else []
+        self.month_days = numbers('BYMONTHDAY')
+        self.months = numbers('BYMONTH')
+        self.positions = numbers('BYSETPOS')
+        self.week_start = WEEKDAYS.index(parts.get('WKST', 'MO'))
+
+    # First date of the period
+    def period(self, number):
+        if self.frequency == 'DAILY':
+            return self.start.date() + datetime.timedelta(days=number * self.interval)
+
+        if self.frequency == 'WEEKLY':
+            week = self.start.date() - datetime.timedelta(days=(self.start.weekday() - self.week_start) % 7)
+            return week + datetime.timedelta(weeks=number * self.interval)
+
+        if self.frequency == 'MONTHLY':
+            month = self.start.year * 12 + self.start.month - 1 + number * self.interval
+            return datetime.date(month // 12, month % 12 + 1, 1)
+
+        return datetime.date(self.start.year + number * self.interval, 1, 1)
+
+    # The periods before the one of after are skipped, unless the occurrences must be counted from the start
+    def first_period(self, after):
+        if self.count is not None or after <= self.start:
+            return 0
+
+        after = after.astimezone(self.start.tzinfo).date()
+        if self.frequency == 'DAILY':
+            periods = (after - self.start.date()).days
+        elif self.frequency == 'WEEKLY':
+            periods = (after - self.start.date()).days // 7
+        elif self.frequency == 'MONTHLY':
+            periods = (after.year - self.start.year) * 12 + after.month - self.start.month
+        else:
+            periods = after.year - self.start.year
+
+        return max(0, periods // self.interval - 1)
+
+    def month_dates(self, year, month):
+        length = calendar.monthrange(year, month)[1]
+
+        month_days = set()
+        for day in self.month_days:
+            day = day if day > 0 else length + 1 + day
+            if 1 <= day <= length:
+                month_days.add(day)
+
+        week_days = set()
+        for position, weekday in self.days:
+            days = [day for day in range(1, length + 1) if calendar.weekday(year, month, day) == weekday]
+            week_days.update(select(days, position))
+
+        if self.month_days and self.days:
+            days = month_days & week_days
+        elif self.month_days:
+            days = month_days
+        elif self.days:
+            days = week_days
+        else:
+            days = [self.start.day] if self.start.day <= length else []
+
+        return [datetime.date(year, month, day) for day in days]
+
+    def matches(self, date):
+        if self.months and date.month not in self.months:
+            return False
+
+        if self.frequency != 'DAILY':
+            return True
+
+        if self.days and date.weekday() not in [weekday for _, weekday in self.days]:
+            return False
+
+        if self.month_days:
+            length = calendar.monthrange(date.year, date.month)[1]
+            return any(date.day == (day if day > 0 else length + 1 + day) for day in self.month_days)
+
+        return True
+
+    # Dates of the period, in order
+    def dates(self, first):
+        if self.frequency == 'DAILY':
+            dates = [first]
+        elif self.frequency == 'WEEKLY':
+            weekdays = [weekday for _, weekday in self.days] or [self.start.weekday()]
+            dates = [first + datetime.timedelta(days=(weekday - first.weekday()) % 7) for weekday in weekdays]
+        elif self.frequency == 'MONTHLY':
+            dates = self.month_dates(first.year, first.month)
+        elif self.days and not self.months and not self.month_days:
+            # The positions of BYDAY are counted in the year
+            days = [first + datetime.timedelta(days=day) for day in range(366 if calendar.isleap(first.year) else 365)]
+            dates = []
+            for position, weekday in self.days:
+                dates.extend(select([date for date in days if date.weekday() == weekday], position))
+        else:
+            months = self.months or (range(1, 13) if self.month_days else [self.start.month])
+            dates = [date for month in months for date in self.month_dates(first.year, month)]
+
+        dates = sorted(set(date for date in dates if self.matches(date)))
+        if self.positions:
+            dates = sorted(set(date for position in self.positions for date in select(dates, position)))
+
+        return dates
+
+    # Starts of the occurrences before time_max, the ones of the periods before after may be skipped.
+    # The start of the event is the first occurrence, counted by COUNT even when the rule does not match it (RFC 5545).
+    def starts(self, after, time_max):
+        if self.start >= time_max:
+            return
+
+        yield self.start
+        count = 1
+        limit = min(datetime.MAXYEAR - 1, self.start.year + MAX_YEARS)
+        number = self.first_period(after)
+        while True:
+            first = self.period(number)
+            if first.year > limit or datetime.datetime.combine(first, datetime.time(),
+                                                               tzinfo=self.start.tzinfo) > time_max:
+                return
+
+            for date in self.dates(first):
+                start = datetime.datetime.combine(date, self.start.time(), tzinfo=self.start.tzinfo)
+                if start <= self.start:
+                    continue
+                if self.until is not None and start > self.until:
+                    return
+
+                count += 1
+                if (self.count is not None and count > self.count) or start >= time_max:
+                    return
+
+                yield start
+
+            number += 1
+
+
+# A recurring event, expanded in its own timezone: the occurrences keep their local time across daylight saving time
+# changes. EXDATE removes occurrences and RDATE adds some, the exceptions of single occurrences are applied by src.sync.
+class Recurrence:
+    def __init__(self, item):
+        self.item = item
+
+        start = parse_datetime(item['start']['dateTime'])
+        self.timezone = timezone(item['start'].get('timeZone'), start.tzinfo)
+        self.start = start.astimezone(self.timezone)
+        self.duration = parse_datetime(item['end']['dateTime']) - start
+
+        self.rules = []
+        self.excluded = set()
+        self.included = []
+        for line in item['recurrence']:
+            name, parameters, value = parse_line(line)
+            if name == 'RRULE':
+                self.rules.append(Rule(value, self.start))
+            elif name in ('EXDATE', 'RDATE') and parameters.get('VALUE') != 'PERIOD':
+                tz = timezone(parameters.get('TZID'), self.timezone)
+                dates = [parse_ical_datetime(date, tz, self.start.time()) for date in value.split(',')]
+                if name == 'EXDATE':
+                    self.excluded.update(dates)
+                else:
+                    self.included.extend(date.astimezone(self.timezone) for date in dates)
+            else:
+                raise ValueError('Unsupported recurrence {0}'.format(line))
+
+    # Starts of the occurrences overlapping the window, in order
+    def starts(self, time_min, time_max):
+        after = time_min - self.duration
+
+        starts = set(start for start in [self.start] + self.included if after < start < time_max)
+        for rule in self.rules:
+            starts.update(start for start in rule.starts(after, time_max) if start > after)
+
+        return sorted(start for start in starts if start not in self.excluded)
+
+    # End of the last occurrence, FOREVER when a rule has no end
+    def end(self):
+        if any(rule.count is None and rule.until is None for rule in self.rules):
+            return FOREVER
+
+        last = max([self.start] + self.included)
+        for rule in self.rules:
+            for start in rule.starts(self.start, FOREVER):
+                last = max(last, start)
+
+        return last + self.duration
+
+    # Id of the occurrence, as the ids of the instances listed by the API
+    def instance_id(self, start):
+        return '{0}_{1}'.format(self.item['id'], start.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ'))
+
+    # Event of the occurrence, as listed with singleEvents
+    def occurrence(self, start):
+        end = (start.astimezone(datetime.timezone.utc) + self.duration).astimezone(self.timezone)
+
+        item = dict(self.item)
+        del item['recurrence']
+        item['id'] = self.instance_id(start)
+        item['start'] = dict(self.item['start'], dateTime=start.isoformat())
+        item['end'] = dict(self.item['end'], dateTime=end.isoformat())
+        item['recurringEventId'] = self.item['id']
+        item['originalStartTime'] = item['start']
+
+        return item
@@ -0,0 +1,95 @@
+import datetime
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+# Every refresh trigger goes through the scheduler, triggers close to each other end up in a single refresh.
+# Between triggers the agenda is polled, more often when a meeting is about to start or end.
+class RefreshScheduler(QObject):
+    debounce = 0.5
+    min_age = 60
+    near = 5 * 60
+    near_interval = 60
+    idle_interval = 15 * 60
+    hidden_interval = 30 * 60
+
+    def __init__(self, parent):
+        super(RefreshScheduler, self).__init__(parent)
+
+        self.running = False
+        self.pending = False
+        self.last_refresh = None
+        self.refreshed_at = None
+
+        self.requested = 0
+        self.performed = 0
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self.fire)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setSingleShot(True)
+        self.poll_timer.timeout.connect(lambda: self.request('poll'))
+
+    # Manual requests are done right away, others are skipped if the agenda has just been refreshed
+    def request(self, reason='manual'):
+        self.requested += 1
+
+        if reason != 'manual' and self.age() < self.min_age:
+            return
+
+        if self.running:
+            self.pending = True
+        elif not self.debounce_timer.isActive():
+            self.debounce_timer.start(0 if reason == 'manual' else int(self.debounce * 1000))
+
+    def fire(self):
+        self.poll_timer.stop()
+        self.running = True
+        self.performed += 1
+        self.last_refresh = time.monotonic()
+        self.refreshed_at = datetime.datetime.now()
+
+        self.parent().start_refresh()
+
+    def finished(self, events):
+        self.running = False
+
+        if self.pending:
+            self.pending = False
+            self.debounce_timer.start(int(self.debounce * 1000))
+        else:
+            self.poll_timer.start(int(self.interval(events) * 1000))
+
+    def interval(self, events):
+        if not self.parent().isVisible() or self.parent().isMinimized():
+            return self.hidden_interval
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        boundaries = []
+        for event in events:
+            for date in (event.start, event.end):
+                if date > now:
+                    boundaries.append((date - now).total_seconds())
+
+        if not boundaries:
+            return self.idle_interval
+
+        # Poll often around the next boundary, and wake up in time to be close to it otherwise
+        return max(self.near_interval, min(self.idle_interval, min(boundaries) - self.near))
+
+    def age(self):
+        if self.last_refresh is None:
+            return float('inf')
+
+        return time.monotonic() - self.last_refresh
+
+    def metrics(self):
+        return {
+            'requested': self.requested,
+            'performed': self.performed,
+            'saved': self.requested - self.performed,
+            'refreshed_at': self.refreshed_at,
+        }
@@ -0,0 +1,109 @@
+from PyQt5.QtCore import QRect, QRectF, Qt
+from PyQt5.QtGui import QBrush, QImage, QPainter, QPainterPath, QPen, QPixmap
+from PyQt5.QtWidgets import QGraphicsDropShadowEffect, QGraphicsScene, QWidget
+
+# 'effect': a QGraphicsDropShadowEffect by event, blurred again whenever the event repaints
+# 'pixmap': one shadow rendered once and painted under every event, see CardShadow
+# 'none': no shadow
+# 'auto': the effect up to shadow_threshold events (see src.ui), the pixmap above
+SHADOWS = ('effect', 'pixmap', 'none', 'auto')
+
+
+def drop_shadow_effect():
+    shadow = QGraphicsDropShadowEffect()
+    shadow.setBlurRadius(CardShadow.blur)
+    shadow.setXOffset(0)
+    shadow.setYOffset(CardShadow.offset)
+
+    return shadow
+
+
+# The shadow of a card, rendered once by the drop shadow effect in a nine-patch pixmap: the corners are painted as they
+# are and the edges are stretched along the card. The middle of the pixmap is cleared, the card covers it.
+class CardShadow:
+    blur = 15
+    offset = 2
+    # Of the corners of the cards, see src.theme
+    radius = 5
+    # Around the card, the shadow is offset and blurred up to margin pixels outside of it
+    margin = blur + offset
+    # Inside the card, the blur of the corners reaches up to inset pixels from its edges
+    inset = blur + radius
+
+    def __init__(self):
+        self.pixmap = None
+
+    def render(self):
+        card = QRectF(self.margin, self.margin, 2 * self.inset + 1, 2 * self.inset + 1)
+        size = 2 * (self.margin + self.inset) + 1
+
+        scene = QGraphicsScene()
+        scene.setSceneRect(0, 0, size, size)
+        path = QPainterPath()
+        path.addRoundedRect(card, self.radius, self.radius)
+        item = scene.addPath(path, QPen(Qt.NoPen), QBrush(Qt.black))
+        item.setGraphicsEffect(drop_shadow_effect())
+
+        image = QImage(size, size, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        scene.render(painter)
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+        painter.fillPath(path, Qt.black)
+        painter.end()
+
+        return QPixmap.fromImage(image)
+
+    # Paints the shadow of the card at rect, only if it is in the region being repainted
+    def paint(self, painter, rect, region):
+        outer = rect.adjusted(-self.margin, -self.margin, self.margin, self.margin)
+        if not region.intersects(outer):
+            return
+
+        if self.pixmap is None:
+            self.pixmap = self.render()
+
+        corner = self.margin + self.inset
+        size = self.pixmap.width()
+        # Edges of the columns and rows of the nine patches, in the target and in the pixmap
+        columns = [outer.left(), outer.left() + corner, outer.right() + 1 - corner, outer.right() + 1]
+        rows = [outer.top(), outer.top() + corner, outer.bottom() + 1 - corner, outer.bottom() + 1]
+        sources = [0, corner, size - corner, size]
+
+        for row in range(3):
+            for column in range(3):
+                if row == 1 and column == 1:
+                    continue
+
+                target = QRect(columns[column], rows[row], columns[column + 1] - columns[column],
+                               rows[row + 1] - rows[row])
+                if target.width() > 0 and target.height() > 0:
+                    source = QRect(sources[column], sources[row], sources[column + 1] - sources[column],
+                                   sources[row + 1] - sources[row])
+                    painter.drawPixmap(target, self.pixmap, source)
+
+
+card_shadow = CardShadow()
+
+
+# Paints the shadow of its cards under them, the cards only repaint themselves and the shadow around the repainted area
+class ShadowedWidget(QWidget):
+    def __init__(self, parent=None):
+        super(ShadowedWidget, self).__init__(parent)
+
+        self.cards = []
+
+    def set_cards(self, cards):
+        if cards or self.cards:
+            self.cards = cards
+            self.update()
+
+    def paintEvent(self, event):
+        if not self.cards:
+            return
+
+        painter = QPainter(self)
+        for card in self.cards:
+            if card.isVisible():
+                card_shadow.paint(painter, card.geometry(), event.region())
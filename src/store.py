@@ -0,0 +1,242 @@
+import datetime
+import json
+import sqlite3
+import threading
+from os import path
+
+from main import APPDATA
+from src.record import parse_datetime
+from src.recurrence import Recurrence
+
+# Each migration brings the schema to the next version, the current version is kept in PRAGMA user_version
+MIGRATIONS = [
+    """
+    CREATE TABLE calendars (
+        id TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        sync_token TEXT,
+        time_max TEXT
+    );
+    CREATE TABLE events (
+        calendar_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        start TEXT,
+        end TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (calendar_id, id)
+    );
+    CREATE INDEX events_start ON events (start, end);
+    CREATE INDEX events_calendar ON events (calendar_id);
+    """,
+    """
+    CREATE TABLE calendar_list (
+        id TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """,
+    # Calendars and events are kept by account, the store is a cache so everything is synced again
+    """
+    DROP TABLE events;
+    DROP TABLE calendars;
+    DROP TABLE calendar_list;
+    DELETE FROM meta;
+    CREATE TABLE calendar_list (
+        account TEXT NOT NULL,
+        id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (account, id)
+    );
+    CREATE TABLE calendars (
+        account TEXT NOT NULL,
+        id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        sync_token TEXT,
+        time_max TEXT,
+        PRIMARY KEY (account, id)
+    );
+    CREATE TABLE events (
+        account TEXT NOT NULL,
+        calendar_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        start TEXT,
+        end TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (account, calendar_id, id)
+    );
+    CREATE INDEX events_start ON events (start, end);
+    CREATE INDEX events_calendar ON events (account, calendar_id);
+    """,
+    # Recurring events and their exceptions, when the occurrences are expanded locally (see src.recurrence)
+    """
+    ALTER TABLE events ADD COLUMN recurring INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE events ADD COLUMN recurring_event_id TEXT;
+    ALTER TABLE events ADD COLUMN original_start TEXT;
+    """,
+]
+
+
+# Dates are stored in UTC with a fixed format, so they can be compared as text
+def utc(date):
+    return date.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# A recurring event lasts from its first occurrence to the end of its last one
+def event_bounds(event):
+    if 'dateTime' not in event.get('start', {}) or 'dateTime' not in event.get('end', {}):
+        return None, None
+
+    start = parse_datetime(event['start']['dateTime'])
+    end = parse_datetime(event['end']['dateTime'])
+    if 'recurrence' in event:
+        try:
+            end = Recurrence(event).end()
+        except ValueError:
+            pass
+
+    return utc(start), utc(end)
+
+
+# Start of the occurrence an exception of a recurring event replaces
+def original_start(event):
+    if 'dateTime' not in event.get('originalStartTime', {}):
+        return None
+
+    return utc(parse_datetime(event['originalStartTime']['dateTime']))
+
+
+class Store:
+    path = path.join(APPDATA, 'agenda.db')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+        self.migrate()
+
+    def migrate(self):
+        with self.lock:
+            version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                self.connection.executescript(migration)
+                version += 1
+                self.connection.execute('PRAGMA user_version = {0}'.format(version))
+
+    def meta(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+
+        return default if row is None else json.loads(row[0])
+
+    def set_meta(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def calendar_list(self, account):
+        with self.lock:
+            rows = self.connection.execute('SELECT data FROM calendar_list WHERE account = ? ORDER BY position',
+                                           (account,)).fetchall()
+
+        return [json.loads(data) for data, in rows]
+
+    def save_calendar_list(self, account, items, cleared):
+        with self.lock, self.connection:
+            if cleared:
+                self.connection.execute('DELETE FROM calendar_list WHERE account = ?', (account,))
+
+            position = self.connection.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM calendar_list '
+                                               'WHERE account = ?', (account,)).fetchone()[0]
+            for item in items:
+                if item.get('deleted'):
+                    self.connection.execute('DELETE FROM calendar_list WHERE account = ? AND id = ?',
+                                            (account, item['id']))
+                else:
+                    self.connection.execute(
+                        'INSERT INTO calendar_list (account, id, position, data) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (account, id) DO UPDATE SET data = excluded.data',
+                        (account, item['id'], position, json.dumps(item))
+                    )
+                    position += 1
+
+    def sync_states(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT account, id, sync_token, time_max FROM calendars ORDER BY position').fetchall()
+
+    # Calendars of every account as (account, calendar), their position orders the events starting together
+    def save_calendars(self, calendars):
+        with self.lock, self.connection:
+            keys = set((account, calendar['id']) for account, calendar in calendars)
+            for key in self.connection.execute('SELECT account, id FROM calendars').fetchall():
+                if key not in keys:
+                    self.connection.execute('DELETE FROM events WHERE account = ? AND calendar_id = ?', key)
+                    self.connection.execute('DELETE FROM calendars WHERE account = ? AND id = ?', key)
+
+            for position, (account, calendar) in enumerate(calendars):
+                self.connection.execute(
+                    'INSERT INTO calendars (account, id, position, data) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (account, id) DO UPDATE SET position = excluded.position, data = excluded.data',
+                    (account, calendar['id'], position, json.dumps(calendar))
+                )
+
+    def save_sync(self, account, calendar_id, token, time_max, changes, cleared):
+        with self.lock, self.connection:
+            if cleared:
+                self.connection.execute('DELETE FROM events WHERE account = ? AND calendar_id = ?',
+                                        (account, calendar_id))
+
+            for event_id, event in changes.items():
+                if event is None:
+                    self.connection.execute('DELETE FROM events WHERE account = ? AND calendar_id = ? AND id = ?',
+                                            (account, calendar_id, event_id))
+                else:
+                    start, end = event_bounds(event)
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO events (account, calendar_id, id, start, end, data, recurring, '
+                        'recurring_event_id, original_start) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (account, calendar_id, event_id, start, end, json.dumps(event), 'recurrence' in event,
+                         event.get('recurringEventId'), original_start(event))
+                    )
+
+            self.connection.execute('UPDATE calendars SET sync_token = ?, time_max = ? WHERE account = ? AND id = ?',
+                                    (token, time_max, account, calendar_id))
+
+    # Account, calendar id, id and JSON data of the timed events overlapping the window,
+    # in start time order then in the calendars order
+    def events(self, time_min, time_max):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT events.account, events.calendar_id, events.id, events.data FROM events '
+                'JOIN calendars ON calendars.account = events.account AND calendars.id = events.calendar_id '
+                'WHERE events.end > ? AND events.start < ? ORDER BY events.start, calendars.position',
+                (utc(time_min), utc(time_max))
+            ).fetchall()
+
+    # Rows expanded by src.sync: the events and the recurring events overlapping the window, as for events,
+    # and the exceptions of the recurring events replacing an occurrence starting before its end.
+    # Account, calendar id, id, start, calendar position, JSON data, recurring, recurring event id and overlaps.
+    def recurring_events(self, time_min, time_max):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT events.account, events.calendar_id, events.id, events.start, calendars.position, events.data, '
+                'events.recurring, events.recurring_event_id, events.end > ? AND events.start < ? FROM events '
+                'JOIN calendars ON calendars.account = events.account AND calendars.id = events.calendar_id '
+                'WHERE events.end > ? AND events.start < ? '
+                'OR events.recurring_event_id IS NOT NULL AND events.original_start < ? '
+                'ORDER BY events.start, calendars.position',
+                (utc(time_min), utc(time_max)) * 2 + (utc(time_max),)
+            ).fetchall()
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM events')
+            self.connection.execute('DELETE FROM calendars')
+            self.connection.execute('DELETE FROM calendar_list')
+            self.connection.execute('DELETE FROM meta')
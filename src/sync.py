@@ -0,0 +1,204 @@
+import json
+import threading
+
+from src.logger import get_logger
+from src.metrics import metrics
+from src.record import EventRecord, parse_datetime
+from src.recurrence import Recurrence
+from src.store import utc
+
+
+class CalendarSync:
+    def __init__(self, token=None, time_max=None):
+        self.token = token
+        self.time_max = time_max
+
+        # Changes waiting to be saved in the store, by event id (None when the event was removed)
+        self.changes = {}
+        self.cleared = False
+
+    def covers(self, time_max):
+        return self.token is not None and self.time_max is not None and self.time_max >= time_max
+
+    def reset(self, time_max):
+        self.token = None
+        self.time_max = time_max
+        self.changes = {}
+        self.cleared = True
+
+    # With exceptions, a removed occurrence of a recurring event is kept as a cancelled exception hiding it
+    def apply(self, items, keep, exceptions=False):
+        for item in items:
+            if item.get('status') == 'cancelled' or not keep(item):
+                if exceptions and 'recurringEventId' in item:
+                    self.changes[item['id']] = {
+                        'id': item['id'],
+                        'status': 'cancelled',
+                        'recurringEventId': item['recurringEventId'],
+                        'originalStartTime': item.get('originalStartTime', {}),
+                    }
+                else:
+                    self.changes[item['id']] = None
+            else:
+                self.changes[item['id']] = item
+
+
+class Sync:
+    # Stored events don't have the DETAIL_FIELDS when events.list uses a fields mask
+    partial = True
+    # Recurring events are stored instead of their instances, their occurrences are expanded for each window
+    expand_recurrence = False
+
+    def __init__(self, store):
+        self.store = store
+        # By (account, calendar id)
+        self.calendars = {}
+
+        # The caches are used by the api thread refreshing and by the GUI thread displaying the stored agenda
+        self.lock = threading.Lock()
+        # Records are only built again when the stored data of their event changed
+        self.records = {}
+        # Details fetched by event, kept while the etag of the event is the same: (etag, item)
+        self.details = {}
+        # Parsed recurring events, by key: (data, Recurrence or None when it can't be expanded)
+        self.recurrences = {}
+
+        for account, calendar_id, token, time_max in self.store.sync_states():
+            self.calendars[(account, calendar_id)] = CalendarSync(token, time_max)
+
+    def calendar(self, account, calendar_id):
+        if (account, calendar_id) not in self.calendars:
+            self.calendars[(account, calendar_id)] = CalendarSync()
+
+        return self.calendars[(account, calendar_id)]
+
+    # Calendars of every account, as (account, calendar)
+    def retain(self, calendars):
+        keys = set((account, calendar['id']) for account, calendar in calendars)
+        for key in list(self.calendars):
+            if key not in keys:
+                del self.calendars[key]
+
+        self.store.save_calendars(calendars)
+
+    def clear(self):
+        self.calendars = {}
+        with self.lock:
+            self.details = {}
+            self.recurrences = {}
+        self.store.clear()
+
+    # Every calendar is fully synced again by the next refresh
+    def reset(self):
+        for calendar in self.calendars.values():
+            calendar.token = None
+
+    # Merged timeline of every account. The same meeting may be in several calendars, of one account or of several:
+    # only its first copy is kept, an instance of a recurring event is told from the others by its start.
+    def events(self, time_min, time_max):
+        with self.lock:
+            records = {}
+            seen = set()
+            duplicates = 0
+            if self.expand_recurrence:
+                rows = self.expand(time_min, time_max)
+            else:
+                rows = ((account, calendar_id, event_id, data, None)
+                        for account, calendar_id, event_id, data in self.store.events(time_min, time_max))
+
+            for account, calendar_id, event_id, data, recurrence in rows:
+                key = (account, calendar_id, event_id)
+                cached = self.records.get(key)
+                if cached is None or cached[0] != data:
+                    item = json.loads(data) if recurrence is None else recurrence.occurrence(data[1])
+                    record = EventRecord(item, calendar_id, not self.partial, account)
+
+                    details = self.details.get(key)
+                    if details is not None and details[0] == record.etag:
+                        record.add_details(details[1])
+
+                    cached = (data, record)
+                else:
+                    metrics.count('record cache hits')
+
+                record = cached[1]
+                if record.ical_uid is not None:
+                    if (record.ical_uid, record.start) in seen:
+                        duplicates += 1
+                        continue
+                    seen.add((record.ical_uid, record.start))
+
+                records[key] = cached
+
+            metrics.count('records loaded', len(records))
+            metrics.count('duplicates hidden', duplicates)
+            self.records = records
+            self.details = {key: details for key, details in self.details.items() if key in records}
+
+            return [record for _, record in records.values()]
+
+    # Stored rows with the occurrences of the recurring events in place of the recurring events, an occurrence
+    # replaced by an exception is left out. The data of an occurrence is the one of its recurring event and its start.
+    # Called by events, with the lock held.
+    def expand(self, time_min, time_max):
+        rows = []
+        recurring = []
+        exceptions = {}
+        for row in self.store.recurring_events(time_min, time_max):
+            account, calendar_id, event_id, start, position, data, is_recurring, recurring_event_id, overlaps = row
+            if recurring_event_id is not None:
+                exceptions[(account, calendar_id, event_id)] = (start, position, data, overlaps)
+            elif is_recurring:
+                recurring.append((account, calendar_id, event_id, position, data))
+            else:
+                rows.append((start, position, account, calendar_id, event_id, data, None))
+
+        recurrences = {}
+        for account, calendar_id, event_id, position, data in recurring:
+            key = (account, calendar_id, event_id)
+            recurrence = self.recurrence(key, data)
+            recurrences[key] = (data, recurrence)
+            if recurrence is None:
+                item = json.loads(data)
+                start = parse_datetime(item['start']['dateTime'])
+                if parse_datetime(item['end']['dateTime']) > time_min and start < time_max:
+                    rows.append((utc(start), position, account, calendar_id, event_id, data, None))
+                continue
+
+            for start in recurrence.starts(time_min, time_max):
+                instance_id = recurrence.instance_id(start)
+                if (account, calendar_id, instance_id) not in exceptions:
+                    rows.append((utc(start), position, account, calendar_id, instance_id, (data, start), recurrence))
+
+        # Cancelled exceptions have no start, the others are displayed where they were moved to
+        for (account, calendar_id, event_id), (start, position, data, overlaps) in exceptions.items():
+            if overlaps:
+                rows.append((start, position, account, calendar_id, event_id, data, None))
+
+        self.recurrences = recurrences
+        rows.sort(key=lambda row: row[:2])
+        return [row[2:] for row in rows]
+
+    def recurrence(self, key, data):
+        cached = self.recurrences.get(key)
+        if cached is not None and cached[0] == data:
+            return cached[1]
+
+        try:
+            return Recurrence(json.loads(data))
+        except ValueError as exception:
+            metrics.count('recurrences not expanded')
+            get_logger('sync').warning('Only the first occurrence of {0} is shown: {1}'.format(key[2], exception))
+            return None
+
+    def add_details(self, record, item):
+        with self.lock:
+            self.details[(record.account, record.calendar_id, record.id)] = (item.get('etag'), item)
+            record.add_details(item)
+
+    def save(self):
+        for (account, calendar_id), calendar in self.calendars.items():
+            self.store.save_sync(account, calendar_id, calendar.token, calendar.time_max, calendar.changes,
+                                 calendar.cleared)
+            calendar.changes = {}
+            calendar.cleared = False
@@ -0,0 +1,106 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+
+from src.metrics import metrics
+
+# Colors of the events by colorId, as Google Calendar shows them. Events without colorId have the default color.
+EVENT_COLORS = {
+    '1': '#7986CB',  # Lavender
+    '2': '#33B679',  # Sage
+    '3': '#8E24AA',  # Grape
+    '4': '#E67C73',  # Flamingo
+    '5': '#F6BF26',  # Banana
+    '6': '#F4511E',  # Tangerine
+    '7': '#039BE5',  # Peacock
+    '8': '#616161',  # Graphite
+    '9': '#3F51B5',  # Blueberry
+    '10': '#0B8043',  # Basil
+    '11': '#D50000',  # Tomato
+}
+
+
+# Colors and stylesheet of the application. The stylesheet is built once and installed once by Ui, the event
+# widgets only change the dynamic properties its selectors match: class (event, response status, optional),
+# color (colorId of the event) and state (upcoming or in_progress).
+class Theme:
+    primary = '#3949AB'
+    hover = '#5C6BC0'
+    background = 'white'
+    text = 'white'
+    event = '#7986CB'
+    needs_action = '#304FFE'
+    # In progress events are darker
+    in_progress = 115
+
+    def __init__(self):
+        self.qcolors = {}
+        self.stylesheet = self.build_stylesheet()
+
+    def event_color(self, color_id=None, state=None):
+        color = EVENT_COLORS.get(color_id, self.event)
+        if state == 'in_progress':
+            color = QColor(color).darker(self.in_progress).name().upper()
+
+        return color
+
+    # The default color keeps the summary in the primary color, it is in the text color on the others
+    def summary_color(self, color_id=None):
+        return self.primary if self.event_color(color_id) == self.event else self.text
+
+    # Cached QColor, for the painted renderers
+    def qcolor(self, name):
+        if name not in self.qcolors:
+            self.qcolors[name] = QColor(name)
+
+        return self.qcolors[name]
+
+    def build_stylesheet(self):
+        # TODO: QPushButton[iconOnly="True"] should be circle button
+        rules = [
+            ('QFrame', {'background-color': self.background, 'border': '1px solid ' + self.primary}),
+            ('QPushButton', {'background-color': self.primary, 'color': self.text, 'border-radius': '5px',
+                             'padding': '10px 20px', 'min-width': '50px'}),
+            ('QPushButton[iconOnly="True"]', {'padding': '10px', 'min-width': 'unset'}),
+            ('QPushButton:hover', {'background-color': self.hover}),
+
+            ('Header, Header QWidget', {'height': '20px', 'padding': '5px', 'color': self.text,
+                                        'background-color': self.primary}),
+            ('Header QToolButton', {'background-color': self.primary, 'color': self.text}),
+            ('Header QToolButton:hover', {'background-color': self.hover}),
+
+            ('QWidget#body, QWidget#body QWidget', {'border': '0'}),
+            ('QWidget[class~="event"]', {'background-color': self.event, 'border-radius': '5px'}),
+            ('QWidget[class~="event"] QLabel', {'background-color': 'transparent', 'color': self.text}),
+            ('QWidget[class~="needsAction"]', {'border-top': '5px solid ' + self.needs_action,
+                                               'border-top-left-radius': '0', 'border-top-right-radius': '0'}),
+            ('QWidget[class~="event"] QLabelClickable', {'color': self.primary, 'font-weight': 'bold',
+                                                         'text-decoration': 'underline'}),
+            ('QWidget[class~="event"] QProgressBar', {'background-color': 'transparent'}),
+            ('QWidget[class~="event"][state="in_progress"]',
+             {'background-color': self.event_color(None, 'in_progress')}),
+        ]
+
+        for color_id in EVENT_COLORS:
+            selector = 'QWidget[class~="event"][color="{0}"]'.format(color_id)
+            rules.append((selector, {'background-color': self.event_color(color_id)}))
+            rules.append((selector + '[state="in_progress"]',
+                          {'background-color': self.event_color(color_id, 'in_progress')}))
+            rules.append((selector + ' QLabelClickable', {'color': self.summary_color(color_id)}))
+
+        return '\n'.join('{0} {{ {1} }}'.format(selector, ' '.join('{0}: {1};'.format(*item)
+                                                                    for item in properties.items()))
+                         for selector, properties in rules)
+
+
+# The style of the widget is computed again after one of its dynamic properties changed.
+# Before the widget is first shown there is nothing to compute again, its style is computed when it is polished.
+def restyle(widget):
+    if not widget.testAttribute(Qt.WA_WState_Polished):
+        return
+
+    metrics.count('restyles')
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)
+
+
+theme = Theme()
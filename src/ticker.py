@@ -0,0 +1,41 @@
+import datetime
+
+from PyQt5.QtCore import QObject, QTimer, Qt
+
+from src.metrics import metrics
+
+
+# Single timer updating the countdown of every event, it only wakes up when a displayed countdown changes
+class Ticker(QObject):
+    max_interval = 60
+
+    def __init__(self, parent):
+        super(Ticker, self).__init__(parent)
+
+        self.widgets = []
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+    def set_widgets(self, widgets):
+        self.widgets = list(widgets)
+        self.tick()
+
+    def tick(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        interval = self.max_interval
+        widgets = self.widgets
+        with metrics.span('tick', widgets=len(widgets)):
+            for widget in widgets:
+                delay = widget.countdown(now)
+                # An ended event displayed the agenda again, the new widgets were already ticked and the timer started
+                if self.widgets is not widgets:
+                    return
+
+                if delay is not None:
+                    interval = min(interval, delay)
+
+        self.timer.start(int(interval * 1000))
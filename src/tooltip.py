@@ -0,0 +1,138 @@
+from html import escape
+from html.parser import HTMLParser
+
+from PyQt5.QtCore import QObject, QEvent
+from PyQt5.QtGui import QCursor
+from PyQt5.QtWidgets import QToolTip
+
+EVENT_TYPE_TEXT = {
+    'default': 'Regular',
+    'outOfOffice': 'Out-of-office',
+}
+
+
+# Keep the formatting tags Google Calendar writes in descriptions, everything else is dropped
+class HtmlSanitizer(HTMLParser):
+    allowed_tags = {'a', 'b', 'strong', 'i', 'em', 'u', 'br', 'p', 'ul', 'ol', 'li', 'span', 'div'}
+    dropped_tags = {'script', 'style'}
+    allowed_schemes = ('http://', 'https://', 'mailto:')
+
+    def __init__(self):
+        super(HtmlSanitizer, self).__init__(convert_charrefs=True)
+
+        self.result = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.dropped_tags:
+            self.dropping += 1
+        elif tag in self.allowed_tags and not self.dropping:
+            href = dict(attrs).get('href') or ''
+            if tag == 'a' and href.startswith(self.allowed_schemes):
+                self.result.append('<a href="{0}">'.format(escape(href)))
+            else:
+                self.result.append('<{0}>'.format(tag))
+
+    def handle_endtag(self, tag):
+        if tag in self.dropped_tags:
+            self.dropping = max(0, self.dropping - 1)
+        elif tag in self.allowed_tags and tag != 'br' and not self.dropping:
+            self.result.append('</{0}>'.format(tag))
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.result.append(escape(data).replace('\n', '<br>'))
+
+
+def sanitize_html(text):
+    sanitizer = HtmlSanitizer()
+    sanitizer.feed(text)
+    sanitizer.close()
+
+    return ''.join(sanitizer.result)
+
+
+def person(data):
+    text = ''
+    if 'displayName' in data:
+        text += ' "{0}"'.format(data['displayName'])
+
+    if 'email' in data:
+        text += ' <{0}>'.format(data['email'])
+
+    return escape(text)
+
+
+# TODO: Display pretty date
+def event_tooltip(record):
+    if record.tooltip is not None:
+        return record.tooltip
+
+    text = escape(record.summary)
+
+    if record.organizer:
+        text += '<br><br>Organizer:' + person(record.organizer)
+
+    if record.location:
+        text += '<br>Location: ' + escape(record.location)
+
+    if record.description:
+        text += '<br>Description: ' + sanitize_html(record.description)
+    elif not record.details:
+        text += '<br>Description: <i>Loading...</i>'
+
+    text += '<br><br>Event type: ' + escape(EVENT_TYPE_TEXT.get(record.event_type, record.event_type))
+    text += '<br>Optional: ' + str(record.optional)
+    text += '<br>Response status: ' + escape(record.response_status or 'Unknown')
+
+    if record.created:
+        text += '<br>Created at: ' + escape(record.created)
+    if record.creator:
+        text += ' By' + person(record.creator)
+    if record.updated:
+        text += '<br>Last modification: ' + escape(record.updated)
+
+    # Kept on the record, which is built again when the event changes
+    if record.details:
+        record.tooltip = text
+
+    return text
+
+
+def conference_tooltip(record):
+    if record.conference_tooltip is not None:
+        return record.conference_tooltip
+
+    text = escape(record.conference_name or '')
+    if record.conference_notes:
+        text += '<br><br>Notes: ' + sanitize_html(record.conference_notes)
+    elif not record.details:
+        text += '<br><br>Notes: <i>Loading...</i>'
+
+    if record.details:
+        record.conference_tooltip = text
+
+    return text
+
+
+# Build the tooltip of a widget the first time it is about to be shown
+class LazyToolTip(QObject):
+    def __init__(self, widget, build):
+        super(LazyToolTip, self).__init__(widget)
+
+        self.build = build
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.ToolTip:
+            # The qt tag forces the rich text rendering, even without any other tag
+            QToolTip.showText(event.globalPos(), '<qt>{0}</qt>'.format(self.build()), watched)
+            return True
+
+        return False
+
+    # Build the shown tooltip again, when what it displays has been loaded
+    def refresh(self):
+        widget = self.parent()
+        if QToolTip.isVisible() and widget.underMouse():
+            QToolTip.showText(QCursor.pos(), '<qt>{0}</qt>'.format(self.build()), widget)
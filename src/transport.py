@@ -0,0 +1,149 @@
+import os
+import threading
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from src.client import CircuitBreaker, RequestBudget, ResilientHttp
+from src.metrics import MeteredHttp, metrics
+
+USER_AGENT = 'Today Overview (gzip)'
+
+
+# httplib2 interface over a requests session, as expected by googleapiclient
+class SessionHttp:
+    def __init__(self, session, timeout):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout,
+                                        allow_redirects=redirections > 0)
+
+        info = dict(response.headers)
+        info['status'] = str(response.status_code)
+        # The content is already decoded by requests, as httplib2 does
+        if 'Content-Encoding' in response.headers:
+            info['-content-encoding'] = info.pop('Content-Encoding')
+
+        result = httplib2.Response(info)
+        result.reason = response.reason
+
+        return result, response.content
+
+
+# Session class reading the proxies of the environment once by host (see Transport.environ_proxies), requests reads
+# them again for every request. NO_PROXY and .netrc are still applied. requests is only imported when needed.
+@lru_cache(maxsize=None)
+def cached_proxies(session_class):
+    from requests.sessions import merge_setting
+
+    class CachedProxiesSession(session_class):
+        def merge_environment_settings(self, url, proxies, stream, verify, cert):
+            if not self.trust_env or (proxies and 'no_proxy' in proxies):
+                parent = super(CachedProxiesSession, self)
+                return parent.merge_environment_settings(url, proxies, stream, verify, cert)
+
+            # The CA bundle of the environment is already the one of the session, see Transport.mount
+            if verify is True or verify is None:
+                verify = self.verify
+
+            return {
+                'proxies': merge_setting(dict(transport.environ_proxies(url), **(proxies or {})), self.proxies),
+                'stream': merge_setting(stream, self.stream),
+                'verify': merge_setting(verify, self.verify),
+                'cert': merge_setting(cert, self.cert),
+            }
+
+    return CachedProxiesSession
+
+
+# JSON model of googleapiclient timing the parsing of the responses, googleapiclient is only imported when needed
+def metered_json_model():
+    from googleapiclient.model import JsonModel
+
+    class MeteredJsonModel(JsonModel):
+        def deserialize(self, content):
+            with metrics.span('parse'):
+                return super(MeteredJsonModel, self).deserialize(content)
+
+    return MeteredJsonModel()
+
+
+# Every request of the application goes through the pooled keep-alive sessions of the transport, with gzip.
+# Sessions are shared by the worker threads, urllib3 pools are thread-safe.
+# The sessions of every account share one adapter, so one pool of connections to the API,
+# and one request budget and circuit breaker (see src.client).
+class Transport:
+    pool_size = 16
+    timeout = 30
+    requests_per_minute = 600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.budget = RequestBudget(self.requests_per_minute)
+        self.breaker = CircuitBreaker()
+        self.adapter = None
+        self.session = None
+        # By account
+        self.api_sessions = {}
+        # Proxies of the environment by scheme and host
+        self.proxies = {}
+
+    def mount(self, session):
+        from requests.adapters import HTTPAdapter
+
+        if self.adapter is None:
+            self.adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.headers['User-Agent'] = USER_AGENT
+        session.verify = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE') or True
+
+        return session
+
+    # With the NO_PROXY bypass of the host. The proxies of the environment are not expected to change while running.
+    def environ_proxies(self, url):
+        from requests.utils import get_environ_proxies
+
+        parts = urlparse(url)
+        key = (parts.scheme, parts.netloc)
+        if key not in self.proxies:
+            self.proxies[key] = get_environ_proxies(url)
+
+        return self.proxies[key]
+
+    # Session without credentials, for icons and the discovery document
+    def public_session(self):
+        with self.lock:
+            if self.session is None:
+                import requests
+
+                self.session = self.mount(cached_proxies(requests.Session)())
+
+            return self.session
+
+    def get(self, url, headers=None):
+        return self.public_session().get(url, headers=headers, timeout=self.timeout)
+
+    # Http given to googleapiclient, the credentials are refreshed by the session when they expired.
+    # The previous session of the account is not closed, it would close the adapter shared with the other sessions.
+    def authorize(self, credentials, account='default'):
+        from google.auth.transport.requests import AuthorizedSession
+
+        with self.lock:
+            self.api_sessions[account] = self.mount(cached_proxies(AuthorizedSession)(credentials))
+
+            return ResilientHttp(MeteredHttp(SessionHttp(self.api_sessions[account], self.timeout)), self.budget,
+                                 self.breaker)
+
+    # Used by the token refresh, the request reuses a pooled connection to the token endpoint
+    def auth_request(self):
+        from google.auth.transport.requests import Request
+
+        return Request(self.public_session())
+
+
+transport = Transport()
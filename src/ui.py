@@ -1,31 +1,46 @@
 import datetime
-import os.path
-from os import path
-from urllib.error import URLError, HTTPError, ContentTooShortError
-from urllib.request import urlopen
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from PyQt5.QtCore import Qt, QMetaObject, QSettings
+from PyQt5.QtCore import Qt, QEvent, QMetaObject, QSettings, QThreadPool, QTimer, pyqtSignal
 from PyQt5.QtGui import QPixmap, QIcon
-from PyQt5.QtWidgets import QFrame, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLayout
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
-from main import APPDATA, SCOPES, NAME
+from PyQt5.QtWidgets import QFrame, QVBoxLayout, QHBoxLayout, QPushButton, QLayout
+from googleapiclient.errors import HttpError
+
+from main import NAME
+from src.account import DEFAULT_ACCOUNT, Account
+from src.agenda import AgendaView
+from src.busy import BusyBars, busy_blocks
+from src.client import CircuitOpenError, ResilientHttp
+from src.discovery import revalidate_discovery_document
 from src.event import Event
 from src.header import Header
-from src.utilities import clear_layout, handle_error
+from src.icons import IconCache
+from src.metrics import metrics
+from src.record import DETAIL_FIELDS, events_fields
+from src.scheduler import RefreshScheduler
+from src.shadow import SHADOWS, ShadowedWidget
+from src.store import Store, utc
+from src.sync import Sync
+from src.theme import theme
+from src.ticker import Ticker
+from src.utilities import handle_error, log_startup, paged_query, timed
+from src.window import WINDOW_MODES, local_midnight, prefetch_end, window_end
+from src.worker import Worker
 
 
 class Ui(QFrame):
+    icon_loaded = pyqtSignal(str)
+    details_loaded = pyqtSignal(str)
+
     flags = Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint
     settings = None
 
     header = None
     body = None
 
+    refresh_button = None
+
     mouse_down = False
     old_position = None
 
@@ -33,20 +48,128 @@ class Ui(QFrame):
     column_layout = None
     events_layout = None
 
-    token_path = path.join(APPDATA, 'token.json')
-    credentials = None
-    service = None
+    # The default account, then the ones listed by the accounts setting. Their calendars are synced together.
+    accounts = []
+    store = None
+    sync = None
+    concurrency = 4
+    calendar_list_ttl = 3600
+
+    # events.list only returns the fields read by these features, the details are fetched for one event on demand
+    event_features = ('agenda', 'conference', 'tooltip')
+    partial_responses = True
+    details_loading = set()
+
+    # events.list returns the recurring events with their exceptions instead of every instance of the window,
+    # the occurrences are expanded locally for any window (see src.recurrence)
+    local_recurrence = False
+
+    # Calendars only shown as busy blocks, fetched together by one freebusy.query instead of events.list
+    busy_calendars = []
+    busy_batch = 50
+    busy = []
+    busy_bars = None
+
+    # See src.window, the next day is prefetched and the window rolls over at local midnight without any request.
+    # A window of hours moves every rollover_interval seconds.
+    window_mode = 'today'
+    window_size = 1
+    rollover_timer = None
+    rollover_interval = 60
+    rollover_day = None
+
+    # 'widgets', 'list' or 'auto' (list above list_threshold events)
+    renderer = 'auto'
+    list_threshold = 50
+    agenda_view = None
+    # Shadow of the event widgets, see src.shadow
+    shadows = 'auto'
+    shadow_threshold = 10
+
+    # Google API calls are queued on a single thread, icons are downloaded on the global pool
+    api_pool = None
+    workers = set()
+    # A new account logs in on its own thread, the refreshes go on meanwhile
+    login_pool = None
+    login_timeout = 5 * 60
+    logging_in = False
+    scheduler = None
+    ticker = None
+
+    # The token is refreshed token_margin seconds before it expires
+    token_timer = None
+    token_margin = 5 * 60
+    token_retry = 60
+    token_max_delay = 24 * 3600
 
     calendars = []
     events = []
+    event_widgets = {}
     icons = {}
-
-    def __init__(self):
+    icons_loading = set()
+    icon_cache = None
+
+    started = None
+    startup = None
+    # Set while the refreshes fail, the last agenda stays displayed
+    failed_at = None
+    # Set during display, an event ending then is removed by the next display
+    displaying = False
+    event_ended_pending = False
+
+    def __init__(self, started=None, imported=None):
         super(Ui, self).__init__(None, self.flags)
 
-        self.authorize()
+        self.started = time.perf_counter() if started is None else started
+        self.startup = {}
+        if started is not None and imported is not None:
+            self.startup['import'] = imported - started
+
+        self.store = Store()
+        self.sync = Sync(self.store)
+
+        self.scheduler = RefreshScheduler(self)
+        self.ticker = Ticker(self)
+        self.icon_cache = IconCache()
+
+        self.token_timer = QTimer(self)
+        self.token_timer.setSingleShot(True)
+        self.token_timer.timeout.connect(self.start_token_refresh)
+
+        self.rollover_timer = QTimer(self)
+        self.rollover_timer.setSingleShot(True)
+        self.rollover_timer.setTimerType(Qt.PreciseTimer)
+        self.rollover_timer.timeout.connect(self.rollover)
 
         self.settings = QSettings(NAME, NAME)
+        self.accounts = [Account(name) for name in [DEFAULT_ACCOUNT] + self.settings.value('accounts', [], list)]
+        self.concurrency = max(1, self.settings.value('concurrency', self.concurrency, int))
+        self.calendar_list_ttl = self.settings.value('calendar_list_ttl', self.calendar_list_ttl, int)
+        self.renderer = self.settings.value('renderer', self.renderer)
+        self.list_threshold = self.settings.value('list_threshold', self.list_threshold, int)
+        self.shadows = self.settings.value('shadows', self.shadows)
+        if self.shadows not in SHADOWS:
+            self.shadows = 'auto'
+        self.shadow_threshold = self.settings.value('shadow_threshold', self.shadow_threshold, int)
+        self.partial_responses = self.settings.value('partial_responses', self.partial_responses, bool)
+        self.sync.partial = self.partial_responses
+        self.local_recurrence = self.settings.value('local_recurrence', self.local_recurrence, bool)
+        self.sync.expand_recurrence = self.local_recurrence
+        self.busy_calendars = self.settings.value('busy_calendars', self.busy_calendars, list)
+        self.window_mode = self.settings.value('window_mode', self.window_mode)
+        if self.window_mode not in WINDOW_MODES:
+            self.window_mode = 'today'
+        self.window_size = max(1, self.settings.value('window_size', self.window_size, int))
+
+        self.api_pool = QThreadPool(self)
+        self.api_pool.setMaxThreadCount(1)
+        self.login_pool = QThreadPool(self)
+        self.login_pool.setMaxThreadCount(1)
+        worker = Worker(self.authorize)
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(self.schedule_token_refresh)
+        self.run(self.api_pool, worker)
+        self.run(QThreadPool.globalInstance(), Worker(revalidate_discovery_document))
 
         geometry = self.settings.value('geometry')
         if geometry:
@@ -54,60 +177,13 @@ class Ui(QFrame):
 
         self.setFrameShape(QFrame.StyledPanel)
 
-        # TODO: QPushButton[iconOnly="True"] should be circle button
-        css = """
-        QFrame {
-            background-color: white;
-            border: 1px solid #3949AB;
-        }
-        QPushButton {
-            background-color: #3949AB;
-            color: white;
-            border-radius: 5px;
-            padding: 10px 20px;
-            min-width: 50px;
-        }
-        QPushButton[iconOnly="True"] {
-            padding: 10px;
-            min-width: unset;
-        }
-        QPushButton:hover {
-            background-color: #5C6BC0;
-        }
-        """
-        self.setStyleSheet(css)
+        # The only stylesheet of the window, parsed once for every widget
+        self.setStyleSheet(theme.stylesheet)
         self.setMouseTracking(True)
 
         self.header = Header(self)
-        self.body = QWidget(self)
-
-        css = """
-        QWidget {
-            border: 0;
-        }
-        QWidget[class~="event"] {
-            background-color: #7986CB;
-            border-radius: 5px;
-        }
-        QWidget[class~="event"] QLabel {
-            background-color: #7986CB;
-            color: white;
-        }
-        QWidget[class~="needsAction"] {
-            border-top: 5px Solid #304FFE;
-            border-top-left-radius: 0;
-            border-top-right-radius: 0;
-        }
-        QWidget[class~="event"] QLabelClickable {
-            color: #3949AB;
-            font-weight: bold;
-            text-decoration: underline;
-        }
-        QProgressBar {
-            background-color: #7986CB;
-        }
-        """
-        self.body.setStyleSheet(css)
+        self.body = ShadowedWidget(self)
+        self.body.setObjectName('body')
 
         self.header_layout = QVBoxLayout(self)
         self.header_layout.setSizeConstraint(QLayout.SetFixedSize)
@@ -127,6 +203,12 @@ class Ui(QFrame):
     def closeEvent(self, event):
         self.settings.setValue('geometry', self.saveGeometry())
 
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange and event.oldState() & Qt.WindowMinimized:
+            self.scheduler.request('shown')
+
+        super(Ui, self).changeEvent(event)
+
     def mousePressEvent(self, event):
         self.old_position = event.pos()
         self.mouse_down = event.button() == Qt.LeftButton
@@ -134,36 +216,144 @@ class Ui(QFrame):
     def mouseReleaseEvent(self, event):
         self.mouse_down = False
 
+    # Google modules are imported on the api pool, they are not needed to display the stored agenda.
+    # Offline, an expired token can't be refreshed and a missing discovery document can't be downloaded: the account is
+    # left without service, the stored agenda stays displayed and the account is authorized again by the next refresh.
     def authorize(self):
-        if os.path.exists(self.token_path):
-            self.credentials = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+        from google.auth.exceptions import GoogleAuthError
+        from requests import RequestException
+
+        with metrics.span('authorize'):
+            for account in self.accounts:
+                if account.service is not None:
+                    continue
 
-        if not self.credentials or not self.credentials.valid:
-            if self.credentials and self.credentials.expired and self.credentials.refresh_token:
                 try:
-                    self.credentials.refresh(Request())
-                except RefreshError:
-                    os.remove(self.token_path)
-                    self.credentials = None
-                    return self.authorize()
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                self.credentials = flow.run_local_server(port=0)
+                    with timed(self.startup, 'auth'):
+                        account.load_credentials()
+
+                    with timed(self.startup, 'service build'):
+                        account.build_service()
+                except (GoogleAuthError, RequestException) as exception:
+                    handle_error(exception, 'auth', 'Authorization of {0} failed: {1}'.format(account.name, exception))
+
+    def account(self, name):
+        for account in self.accounts:
+            if account.name == name:
+                return account
+
+        return None
+
+    # The timer is set for the token expiring first
+    def schedule_token_refresh(self):
+        self.token_timer.stop()
+        delays = [delay for delay in (account.expires_in() for account in self.accounts) if delay is not None]
+        if not delays:
+            return
+
+        delay = min(delays) - self.token_margin
+        self.token_timer.start(int(min(self.token_max_delay, max(self.token_retry, delay)) * 1000))
+
+    # Queued on the api pool, so it never runs during a refresh
+    def start_token_refresh(self):
+        worker = Worker(self.refresh_credentials)
+        # noinspection PyUnresolvedReferences
+        worker.signals.finished.connect(self.schedule_token_refresh)
+        self.run(self.api_pool, worker)
+
+    def refresh_credentials(self):
+        from google.auth.exceptions import GoogleAuthError
+
+        for account in self.accounts:
+            delay = account.expires_in()
+            if delay is None or delay > self.token_margin + self.token_retry:
+                continue
+
+            try:
+                with metrics.span('token refresh', account=account.name):
+                    account.refresh_credentials()
+            except GoogleAuthError as exception:
+                # Retried by the next timer, or by the session when a request is refused
+                handle_error(exception, 'auth')
+
+    # Signals must be connected before the worker is started, it may finish before connect() is called
+    def run(self, pool, worker):
+        self.workers.add(worker)
+        # noinspection PyUnresolvedReferences
+        worker.signals.finished.connect(lambda: self.workers.discard(worker))
+        pool.start(worker)
+
+    # Every account is logged out, the default account is logged in again
+    def logout(self):
+        # Anything still queued belongs to the previous accounts
+        for worker in self.workers:
+            worker.cancel()
 
-            with open(self.token_path, 'w') as token:
-                token.write(self.credentials.to_json())
+        self.token_timer.stop()
+        self.settings.setValue('accounts', [])
 
-        self.service = build('calendar', 'v3', credentials=self.credentials)
+        worker = Worker(self.reset_accounts)
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(self.refresh)
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(self.schedule_token_refresh)
+        self.run(self.api_pool, worker)
 
-    def logout(self):
-        if os.path.exists(self.token_path):
-            os.remove(self.token_path)
-            self.credentials = None
+    def reset_accounts(self):
+        for account in self.accounts:
+            account.logout()
 
-            self.authorize()
-            self.refresh()
+        self.accounts = [Account()]
+        self.sync.clear()
+        self.busy = []
+
+        self.authorize()
+
+    # The login of the new account is done on the api pool, it is synced by the next refresh
+    def add_account(self):
+        # A second login would pick the same name
+        if self.logging_in:
+            return
+
+        names = [account.name for account in self.accounts]
+        number = 2
+        while 'account{0}'.format(number) in names:
+            number += 1
+
+        account = Account('account{0}'.format(number))
+        self.logging_in = True
+        worker = Worker(self.login, account)
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(lambda logged_in: self.account_added(account) if logged_in else None)
+        # noinspection PyUnresolvedReferences
+        worker.signals.finished.connect(self.login_finished)
+        self.run(self.login_pool, worker)
+
+    # Run on the login pool. A login which is denied, times out or cannot start leaves the accounts as they are.
+    def login(self, account):
+        from google.auth.exceptions import GoogleAuthError
+        from google_auth_oauthlib.flow import WSGITimeoutError
+        from oauthlib.oauth2 import OAuth2Error
+        from requests import RequestException
+
+        try:
+            account.authorize(self.login_timeout)
+        except (GoogleAuthError, OAuth2Error, WSGITimeoutError, RequestException, OSError, ValueError) as exception:
+            handle_error(exception, 'auth', 'Login of {0} failed: {1}'.format(account.name, exception))
+            return False
+
+        return True
+
+    def login_finished(self):
+        self.logging_in = False
+
+    def account_added(self, account):
+        self.accounts = self.accounts + [account]
+        self.settings.setValue('accounts', [account.name for account in self.accounts[1:]])
+
+        self.schedule_token_refresh()
+        self.refresh()
 
-    # TODO: Make events layout scrollable
     def setup_ui(self):
         self.column_layout = QVBoxLayout(self.body)
         self.column_layout.setSpacing(15)
@@ -171,42 +361,312 @@ class Ui(QFrame):
         menu_layout = QHBoxLayout()
         self.column_layout.addLayout(menu_layout)
 
+        self.busy_bars = BusyBars(self)
+        self.column_layout.addWidget(self.busy_bars)
+
         self.events_layout = QVBoxLayout()
         self.events_layout.setSpacing(15)
         self.column_layout.addLayout(self.events_layout)
 
+        self.agenda_view = AgendaView(self)
+        self.agenda_view.hide()
+        self.column_layout.addWidget(self.agenda_view)
+
         logout_button = QPushButton('Logout')
         logout_button.clicked.connect(self.logout)
         menu_layout.addWidget(logout_button)
 
-        refresh_button = QPushButton('Refresh')
-        refresh_button.clicked.connect(self.refresh)
-        menu_layout.addWidget(refresh_button)
+        add_account_button = QPushButton('Add account')
+        add_account_button.clicked.connect(self.add_account)
+        menu_layout.addWidget(add_account_button)
+
+        self.refresh_button = QPushButton('Refresh')
+        self.refresh_button.clicked.connect(self.refresh)
+        menu_layout.addWidget(self.refresh_button)
 
         QMetaObject.connectSlotsByName(self)
 
+        # The last known agenda is shown right away, while it is refreshed in background
+        self.busy = busy_blocks(self.store.meta('busy', []))
+        self.display(self.sync.events(*self.window()), 'cache')
+        self.schedule_rollover()
         self.refresh()
 
-    # TODO: Subscribe to changes or poll each 15m
-    # TODO: Store when the last refresh happened to prevent unnecessary refresh when event end and send a refresh
     def refresh(self):
-        self.calendars = []
-        self.paged_query(self.refresh_calendars)
+        self.scheduler.request('manual')
+
+    # TODO: Subscribe to changes
+    # Called by the scheduler
+    def start_refresh(self):
+        self.set_refreshing(True)
+
+        worker = Worker(self.fetch, *self.window())
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(self.fetched)
+        # noinspection PyUnresolvedReferences
+        worker.signals.finished.connect(self.refresh_finished)
+        self.run(self.api_pool, worker)
+
+    def fetched(self, events):
+        if events is None:
+            if self.failed_at is None:
+                self.failed_at = datetime.datetime.now()
+        else:
+            self.failed_at = None
+            self.display(events)
+
+    def set_refreshing(self, refreshing):
+        self.refresh_button.setEnabled(not refreshing)
+        if refreshing:
+            self.refresh_button.setText('Refreshing...')
+        else:
+            self.refresh_button.setText('Refresh' if self.failed_at is None else 'Refresh (offline)')
+
+    def refresh_finished(self):
+        self.set_refreshing(False)
+        self.scheduler.finished(self.events)
+
+        scheduler_metrics = self.scheduler.metrics()
+        text = 'Last refresh: {0}\nRefreshes saved: {1}'.format(
+            scheduler_metrics['refreshed_at'].strftime('%H:%M:%S'), scheduler_metrics['saved'])
+        if self.failed_at is not None:
+            text += '\nCalendar API unavailable since {0}, the last agenda is shown'.format(
+                self.failed_at.strftime('%H:%M:%S'))
+        self.refresh_button.setToolTip(text)
+
+    # The ended event is removed using the stored agenda, fetching it again is left to the scheduler.
+    # An event ending while its widget is built by display is removed once that display is over.
+    def event_ended(self):
+        if self.displaying:
+            if not self.event_ended_pending:
+                self.event_ended_pending = True
+                QTimer.singleShot(0, self.event_ended)
+            return
+
+        self.event_ended_pending = False
+        self.display(self.sync.events(*self.window()), 'cache')
+        self.scheduler.request('event_end')
+
+    def window(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        return now, window_end(now, self.window_mode, self.window_size)
 
-        self.events = []
-        now = datetime.datetime.utcnow()  # TODO: Do we need to use a specific timezone?
-        time_min = now.isoformat() + 'Z'
-        time_max = now.replace(hour=23, minute=59, second=59, microsecond=999999).isoformat() + 'Z'
-        for calendar in self.calendars:
-            self.paged_query(self.refresh_events, calendar, time_min, time_max)
+    def schedule_rollover(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.rollover_day = now.astimezone().date()
 
-        clear_layout(self.events_layout)
+        delay = (local_midnight(now) - now).total_seconds()
+        if self.window_mode == 'hours':
+            delay = min(delay, self.rollover_interval)
 
-        for event in self.events:
-            if 'dateTime' in event['start'] and 'dateTime' in event['end']:
-                self.events_layout.addWidget(Event(self, event))
+        self.rollover_timer.start(int(delay * 1000) + 10)
 
-        self.refresh_size()
+    # The prefetched events of the new window are displayed right away, the next day is then fetched in background
+    def rollover(self):
+        self.display(self.sync.events(*self.window()), 'cache')
+
+        if datetime.date.today() != self.rollover_day:
+            self.scheduler.request('rollover')
+
+        self.schedule_rollover()
+
+    # Run on the api pool. Requests are already retried by src.client, when the refresh still fails what was synced
+    # is saved and None is returned: the last agenda stays displayed and the scheduler tries again later.
+    # An expired token refreshed without network fails with a GoogleAuthError, the refresh fails the same way.
+    def fetch(self, now, end):
+        from google.auth.exceptions import GoogleAuthError
+        from requests import RequestException
+
+        try:
+            self.authorize()
+            if all(account.service is None for account in self.accounts):
+                metrics.count('refresh failures')
+                return None
+
+            return self.sync_accounts(now, end)
+        except (HttpError, CircuitOpenError, RequestException, GoogleAuthError) as exception:
+            metrics.count('refresh failures')
+            handle_error(exception, 'api', 'Refresh failed: {0}'.format(exception))
+            self.sync.save()
+            return None
+
+    # The calendar lists of the accounts are refreshed together, then every calendar of every account is synced on one
+    # executor, with as many threads per account as for a single one
+    def sync_accounts(self, now, end):
+        accounts = self.accounts
+        with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+            calendar_lists = list(executor.map(self.account_calendars, accounts))
+
+        self.calendars = [(account, calendar) for account, (calendars, _) in zip(accounts, calendar_lists)
+                          for calendar in calendars]
+        self.sync.retain([(account.name, calendar) for account, calendar in self.calendars])
+
+        # Stored events may miss fields of the new mask, or be instances instead of recurring events
+        fields = self.events_fields()
+        if self.store.meta('events_fields') != fields or \
+                self.store.meta('local_recurrence', False) != self.local_recurrence:
+            self.sync.reset()
+            self.store.set_meta('events_fields', fields)
+            self.store.set_meta('local_recurrence', self.local_recurrence)
+
+        time_min = utc(now)
+        time_max = utc(prefetch_end(end))
+        # Created upfront, the worker threads only look the calendars up
+        for account, calendar in self.calendars:
+            self.sync.calendar(account.name, calendar['id'])
+
+        with ThreadPoolExecutor(max_workers=self.concurrency * len(accounts)) as executor:
+            futures = [executor.submit(self.sync_calendar, account, calendar, time_min, time_max)
+                       for account, calendar in self.calendars]
+            busy_futures = [executor.submit(self.query_busy, account, busy_calendars, time_min, time_max)
+                            for account, (_, busy_calendars) in zip(accounts, calendar_lists)]
+
+        for future in futures:
+            future.result()
+
+        # A calendar shared with several accounts is only shown once
+        busy = []
+        for future in busy_futures:
+            for calendar in future.result():
+                if all(calendar['id'] != other['id'] for other in busy):
+                    busy.append(calendar)
+        if busy or self.busy:
+            self.store.set_meta('busy', busy)
+            self.busy = busy_blocks(busy)
+
+        self.sync.save()
+
+        return self.sync.events(now, end)
+
+    # Calendars of the account synced with their events, and the ones only shown as busy blocks.
+    # The stored calendar list of an account without service is kept, its calendars are not synced.
+    def account_calendars(self, account):
+        synced_at = self.store.meta(account.key('calendar_list_synced_at'))
+        if account.service is not None and (synced_at is None or time.time() - synced_at > self.calendar_list_ttl):
+            try:
+                paged_query(self.refresh_calendars, account)
+            except HttpError as exception:
+                if exception.resp.status != 410:
+                    raise
+
+                self.store.set_meta(account.key('calendar_list_token'), None)
+                paged_query(self.refresh_calendars, account)
+
+        calendar_list = self.store.calendar_list(account.name)
+        busy_calendars = [calendar for calendar in calendar_list if calendar['id'] in self.busy_calendars]
+        calendars = [calendar for calendar in calendar_list
+                     if calendar.get('accessRole') == 'owner' and calendar['id'] not in self.busy_calendars]
+
+        return calendars, busy_calendars
+
+    # The events of a refresh were listed when it started, the ones which ended since then are left out
+    def display(self, events, source='network'):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        events = [event for event in events if event.end > now]
+
+        self.displaying = True
+        try:
+            with metrics.span('display', source=source, events=len(events)):
+                self.events = events
+                self.busy_bars.set_busy(self.busy, *self.window())
+
+                if self.renderer == 'list' or (self.renderer == 'auto' and len(events) > self.list_threshold):
+                    self.display_widgets([])
+                    self.agenda_view.agenda_model.set_records(events)
+                    self.agenda_view.show()
+                    self.agenda_view.updateGeometry()
+                    self.ticker.set_widgets([self.agenda_view.agenda_model, self.busy_bars])
+                else:
+                    self.agenda_view.hide()
+                    self.agenda_view.agenda_model.set_records([])
+                    self.display_widgets(events)
+                    self.ticker.set_widgets(list(self.event_widgets.values()) + [self.busy_bars])
+
+                self.refresh_size()
+
+                if self.events:
+                    self.record_first_paint(source)
+        finally:
+            self.displaying = False
+
+    # Only the event widgets which changed are built again, the others are kept and moved if needed
+    def display_widgets(self, events):
+        widgets = {}
+        for event in events:
+            if event.id in widgets:
+                continue
+
+            widget = self.event_widgets.pop(event.id, None)
+            if widget is None:
+                metrics.count('widgets built')
+                widget = Event(self, event)
+            elif widget.record is not event:
+                # Sync.events keeps the record while the stored data of the event is the same. A new record with the
+                # same etag was stored with other fields (a new fields mask), the widget must show it too.
+                metrics.count('widgets updated')
+                widget.update_record(event)
+            else:
+                metrics.count('widgets reused')
+
+            widgets[event.id] = widget
+
+        for widget in self.event_widgets.values():
+            self.events_layout.removeWidget(widget)
+            widget.deleteLater()
+
+        for index, widget in enumerate(widgets.values()):
+            if self.events_layout.indexOf(widget) != index:
+                self.events_layout.removeWidget(widget)
+                self.events_layout.insertWidget(index, widget)
+
+        self.event_widgets = widgets
+
+        shadow = self.shadow(len(widgets))
+        for widget in widgets.values():
+            widget.set_shadow(shadow == 'effect')
+        self.body.set_cards(list(widgets.values()) if shadow == 'pixmap' else [])
+
+    def shadow(self, count):
+        if self.shadows != 'auto':
+            return self.shadows
+
+        return 'effect' if count <= self.shadow_threshold else 'pixmap'
+
+    def record_first_paint(self, source):
+        name = 'first paint from ' + source
+        if name in self.startup:
+            return
+
+        self.startup[name] = time.perf_counter() - self.started
+        if source == 'network':
+            log_startup(self.startup)
+
+    def sync_calendar(self, account, calendar, time_min, time_max):
+        if account.service is None:
+            return
+
+        with metrics.span('sync_calendar', account=account.name, calendar=calendar['id']):
+            try:
+                try:
+                    paged_query(self.refresh_events, account, calendar, time_min, time_max)
+                except HttpError as exception:
+                    # The sync token expired, the calendar must be fully synced again
+                    if exception.resp.status != 410:
+                        raise
+
+                    self.sync.calendar(account.name, calendar['id']).reset(time_max)
+                    paged_query(self.refresh_events, account, calendar, time_min, time_max)
+            except HttpError as exception:
+                # Deleted or unshared since the calendar list was synced (it is kept calendar_list_ttl seconds): its
+                # events are removed, the other calendars are displayed and the calendar list is synced next time
+                status = exception.resp.status
+                if status != 404 and (status != 403 or ResilientHttp.retryable(exception.resp, exception.content)):
+                    raise
+
+                handle_error(exception, 'api', 'Calendar {0} unavailable: {1}'.format(calendar['id'], exception))
+                self.store.set_meta(account.key('calendar_list_synced_at'), None)
+                self.sync.calendar(account.name, calendar['id']).reset(time_max)
 
     def refresh_size(self):
         size = self.header_layout.sizeHint()
@@ -216,65 +676,163 @@ class Ui(QFrame):
 
         self.setFixedSize(size)
 
-    # TODO: If fail to fetch an uri for X times, find a way to limit future try or stop trying
-    # TODO: Store & restore on drive
     def fetch_icon(self, uri):
         if uri in self.icons:
+            metrics.count('icon memory hits')
             return self.icons[uri]
-        else:
-            try:
-                data = urlopen(uri).read()  # TODO: Investigate on .read() raised exceptions
-            except (URLError, HTTPError, ContentTooShortError) as exception:
-                handle_error(exception)
-                return None
 
-            pixmap = QPixmap()
-            pixmap.loadFromData(data)
-
-            icon = QIcon(pixmap)
-            self.icons[uri] = icon
-
-            return icon
-
-    @staticmethod
-    def paged_query(func, *args, **kwargs):
-        page_token = None
-        while True:
-            page_token = func(page_token, *args, **kwargs)
-
-            if not page_token:
-                break
+        # The icon_loaded signal is sent once the icon is available
+        if uri not in self.icons_loading:
+            self.icons_loading.add(uri)
+
+            worker = Worker(self.icon_cache.fetch, uri)
+            # noinspection PyUnresolvedReferences
+            worker.signals.result.connect(lambda data: self.icon_downloaded(uri, data))
+            self.run(QThreadPool.globalInstance(), worker)
+
+        return None
+
+    def icon_downloaded(self, uri, data):
+        self.icons_loading.discard(uri)
+        if data is None:
+            return
+
+        pixmap = QPixmap()
+        pixmap.loadFromData(data)
+
+        self.icons[uri] = QIcon(pixmap)
+        # noinspection PyUnresolvedReferences
+        self.icon_loaded.emit(uri)
+
+    def events_fields(self):
+        if not self.partial_responses:
+            return None
+
+        return events_fields(self.event_features + (('recurrence',) if self.local_recurrence else ()))
+
+    def load_details(self, record):
+        key = (record.account, record.calendar_id, record.id)
+        account = self.account(record.account)
+        if record.details or key in self.details_loading or record.calendar_id is None or account is None \
+                or account.service is None:
+            return
+
+        self.details_loading.add(key)
+
+        worker = Worker(self.fetch_details, account, record.calendar_id, record.id)
+        # noinspection PyUnresolvedReferences
+        worker.signals.result.connect(lambda item: self.details_fetched(record, item))
+        # noinspection PyUnresolvedReferences
+        worker.signals.finished.connect(lambda: self.details_loading.discard(key))
+        self.run(QThreadPool.globalInstance(), worker)
+
+    # Run on the global pool, the tooltip must not wait for a refresh
+    def fetch_details(self, account, calendar_id, event_id):
+        from google.auth.exceptions import GoogleAuthError
+        from requests import RequestException
+
+        try:
+            with metrics.span('fetch_details', calendar=calendar_id):
+                return account.service.events().get(calendarId=calendar_id, eventId=event_id,
+                                                    fields=DETAIL_FIELDS).execute()
+        except (HttpError, CircuitOpenError, RequestException, GoogleAuthError) as exception:
+            handle_error(exception, 'api', 'Details of {0}: {1}'.format(event_id, exception))
+            return None
+
+    def details_fetched(self, record, item):
+        if item is None:
+            # Not tried again for this record, the tooltip is shown without the details
+            record.details = True
+            record.tooltip = None
+            record.conference_tooltip = None
+        else:
+            self.sync.add_details(record, item)
 
-    def refresh_events(self, page_token, calendar, time_min, time_max):
-        events = self.service.events().list(
-            calendarId=calendar['id'],
-            singleEvents=True,
-            timeMin=time_min,
-            timeMax=time_max,
-            orderBy='startTime',
-            pageToken=page_token,
-            maxAttendees=1,
-            showDeleted=False
-        ).execute()
+        # noinspection PyUnresolvedReferences
+        self.details_loaded.emit(record.id)
 
-        def remove_declined_event(event):
-            if 'attendees' in event and event['attendees'][0]:
-                if event['attendees'][0]['responseStatus'] == 'declined':
-                    return False
+    def refresh_events(self, page_token, account, calendar, time_min, time_max):
+        with metrics.span('refresh_events', calendar=calendar['id'], page=page_token or 'first'):
+            calendar_sync = self.sync.calendar(account.name, calendar['id'])
 
-            return True
+            # Only the changes since the last sync are listed, the window is applied locally in Sync.events
+            if calendar_sync.covers(time_max):
+                query = {'syncToken': calendar_sync.token}
+            else:
+                if page_token is None:
+                    calendar_sync.reset(time_max)
+
+                query = {'timeMin': time_min, 'timeMax': time_max}
+
+            events = account.service.events().list(
+                calendarId=calendar['id'],
+                singleEvents=not self.local_recurrence,
+                pageToken=page_token,
+                maxAttendees=1,
+                fields=self.events_fields(),
+                **query
+            ).execute()
+
+            def remove_declined_event(event):
+                if 'attendees' in event and event['attendees'][0]:
+                    if event['attendees'][0].get('responseStatus') == 'declined':
+                        return False
+
+                return True
+
+            calendar_sync.apply(events['items'], remove_declined_event, self.local_recurrence)
+
+            if 'nextSyncToken' in events:
+                calendar_sync.token = events['nextSyncToken']
+
+            return events.get('nextPageToken')
+
+    # Busy blocks of the busy-only calendars of the account, one request per busy_batch calendars without event data
+    def query_busy(self, account, calendars, time_min, time_max):
+        # The stored busy blocks are kept until the account is authorized again
+        if account.service is None:
+            ids = [calendar['id'] for calendar in calendars]
+            return [calendar for calendar in self.store.meta('busy', []) if calendar['id'] in ids]
+
+        busy = []
+        for offset in range(0, len(calendars), self.busy_batch):
+            batch = calendars[offset:offset + self.busy_batch]
+            with metrics.span('query_busy', calendars=len(batch)):
+                response = account.service.freebusy().query(body={
+                    'timeMin': time_min,
+                    'timeMax': time_max,
+                    'items': [{'id': calendar['id']} for calendar in batch],
+                }, fields='calendars').execute()
+
+            for calendar in batch:
+                result = response.get('calendars', {}).get(calendar['id'], {})
+                for error in result.get('errors', []):
+                    handle_error(error.get('reason'), 'api', 'Busy blocks of {0}: {1}'.format(
+                        calendar['id'], error.get('reason')))
+
+                busy.append({
+                    'id': calendar['id'],
+                    'summary': calendar.get('summaryOverride') or calendar.get('summary') or calendar['id'],
+                    'busy': result.get('busy', []),
+                })
+
+        return busy
 
-        self.events += filter(remove_declined_event, events['items'])
+    # TODO: Let user choose which calendar the want to fetch events from
+    def refresh_calendars(self, page_token, account):
+        with metrics.span('refresh_calendars', account=account.name, page=page_token or 'first'):
+            token = self.store.meta(account.key('calendar_list_token'))
 
-        return events.get('nextPageToken')
+            # minAccessRole can't be used with a sync token, the owned calendars are filtered in account_calendars
+            calendar_list = account.service.calendarList().list(
+                pageToken=page_token,
+                **({'syncToken': token} if token else {})
+            ).execute()
 
-    # TODO: Let user choose which calendar the want to fetch events from
-    def refresh_calendars(self, page_token):
-        calendar_list = self.service.calendarList().list(
-            pageToken=page_token,
-            minAccessRole='owner'
-        ).execute()
+            self.store.save_calendar_list(account.name, calendar_list['items'], page_token is None and token is None)
 
-        self.calendars += calendar_list['items']
+            if 'nextSyncToken' in calendar_list:
+                self.store.set_meta(account.key('calendar_list_token'), calendar_list['nextSyncToken'])
+                self.store.set_meta(account.key('calendar_list_synced_at'), time.time())
 
-        return calendar_list.get('nextPageToken')
+            return calendar_list.get('nextPageToken')
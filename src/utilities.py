@@ -1,19 +1,21 @@
 import datetime
 import sys
+import time
+from contextlib import contextmanager
 from os import path
 
 from main import APPDATA
+from src.logger import get_logger, stop_logging
+from src.metrics import metrics
 
 
 def clear_layout(layout):
-    while layout.count():
-        clear_widget(layout.takeAt(0))
+    with metrics.span('clear_layout'):
+        while layout.count():
+            clear_widget(layout.takeAt(0))
 
 
 def clear_widget(item):
-    if hasattr(item, 'timer'):
-        item.timer.stop()
-
     if item.layout():
         clear_layout(item.layout())
 
@@ -21,19 +23,43 @@ def clear_widget(item):
         item.widget().deleteLater()
 
 
-def handle_error(message):
-    now = datetime.datetime.utcnow().isoformat() + 'Z'
-    with open(path.join(APPDATA, 'errors.log'), 'a') as file:
-        file.write('[{0}] {1}\n'.format(now, message))
+def paged_query(func, *args, **kwargs):
+    page_token = None
+    while True:
+        page_token = func(page_token, *args, **kwargs)
 
+        if not page_token:
+            break
 
-def except_hook(cls, exception, traceback):
+
+# Logged to errors.log by the background writer of src.logger, message defaults to the text of the exception
+def handle_error(error, subsystem='app', message=None):
+    if isinstance(error, BaseException):
+        get_logger(subsystem).error(message or str(error), exc_info=(type(error), error, error.__traceback__))
+    else:
+        get_logger(subsystem).error(message or error)
+
+
+# Only the first measure of a name is kept
+@contextmanager
+def timed(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.setdefault(name, time.perf_counter() - start)
+
+
+def log_startup(timings):
     now = datetime.datetime.utcnow().isoformat() + 'Z'
-    message = '[{0}] type: {1}\n[{0}] exception: {2}\n[{0}] traceback: {3}\n'.format(now, cls, exception, traceback)
-    print(message)
+    with open(path.join(APPDATA, 'startup.log'), 'a') as file:
+        file.write('[{0}] {1}\n'.format(now, ', '.join('{0}: {1:.3f}s'.format(*timing) for timing in timings.items())))
 
-    with open(path.join(APPDATA, 'crash.log'), 'a') as file:
-        file.write(message)
+
+def except_hook(cls, exception, traceback):
+    get_logger('crash').critical('{0}: {1}'.format(cls.__name__, exception), exc_info=(cls, exception, traceback))
+    # The process exits right after, the queued records must be written first
+    stop_logging()
 
     sys.__excepthook__(cls, exception, traceback)
     sys.exit(1)
@@ -0,0 +1,27 @@
+import datetime
+
+# The displayed window ends at the next local midnight ('today'), window_size hours later ('hours')
+# or at the local midnight after window_size days ('days')
+WINDOW_MODES = ('today', 'hours', 'days')
+
+
+# Naive local dates are converted with the offset of that date, it differs from the current one across DST changes
+def local_midnight(date, days=1):
+    return datetime.datetime.combine(date.astimezone().date() + datetime.timedelta(days=days),
+                                     datetime.time()).astimezone()
+
+
+def window_end(now, mode='today', size=1):
+    if mode == 'hours':
+        return now + datetime.timedelta(hours=size)
+
+    if mode == 'days':
+        return local_midnight(now, max(1, size))
+
+    return local_midnight(now)
+
+
+# Events are synced until the end of the day after the window, so the window rolls over at midnight from the store.
+# The bound only changes once a day, a sync token stays valid for the whole day.
+def prefetch_end(end):
+    return local_midnight(end - datetime.timedelta(microseconds=1), 2)
@@ -0,0 +1,49 @@
+import sys
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class WorkerSignals(QObject):
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    finished = pyqtSignal()
+
+
+# Run a blocking function on a QThreadPool, results are sent back to the GUI thread through signals
+class Worker(QRunnable):
+    def __init__(self, func, *args, **kwargs):
+        super(Worker, self).__init__()
+
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+        self.signals = WorkerSignals()
+        self.signals.error.connect(self.raise_error)
+
+    # The function keeps running if already started but its result is dropped
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as exception:
+            if not self.cancelled:
+                # noinspection PyUnresolvedReferences
+                self.signals.error.emit(exception)
+        else:
+            if not self.cancelled:
+                # noinspection PyUnresolvedReferences
+                self.signals.result.emit(result)
+        finally:
+            # noinspection PyUnresolvedReferences
+            self.signals.finished.emit()
+
+    @staticmethod
+    def raise_error(exception):
+        sys.excepthook(type(exception), exception, exception.__traceback__)